@@ -0,0 +1,38 @@
+"""
+Mede o custo do bcrypt nesta máquina.
+
+Uso:
+    python -m app.calibrate           # mostra o custo recomendado
+    python -m app.calibrate --save    # grava o custo para todos os workers (BCRYPT_CALIBRATE=true)
+
+Com BCRYPT_CALIBRATE=true, o primeiro processo a subir já calibra e grava o custo sozinho.
+Este comando serve para medir de novo, por exemplo depois de trocar a máquina do deploy.
+Os workers leem o valor na inicialização, então ele vale a partir do próximo reinício.
+"""
+
+import asyncio
+import argparse
+
+from . import utils
+
+
+def _parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m app.calibrate", description="Calibra o custo do bcrypt.")
+    parser.add_argument("--target-ms", type=float, default=utils.BCRYPT_TARGET_MS, help="tempo máximo de um hash")
+    parser.add_argument("--save", action="store_true", help="grava o custo no banco para todos os workers")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = _parse_args(argv)
+    rounds = utils.calibrate_rounds(args.target_ms)
+    print(f"Custo recomendado: {rounds} (até {args.target_ms:.0f} ms por hash nesta máquina).")
+    if args.save:
+        asyncio.run(utils.store_calibrated_rounds(rounds))
+        print("Custo gravado; os workers passam a usá-lo no próximo reinício.")
+    else:
+        print(f"Use BCRYPT_ROUNDS={rounds} ou rode com --save (BCRYPT_CALIBRATE=true).")
+
+
+if __name__ == "__main__":
+    main()
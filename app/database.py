@@ -1,6 +1,9 @@
 import os
 from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection
+from pymongo import ASCENDING, IndexModel
+
+from . import metrics
 
 # Carrega as variáveis de ambiente do arquivo .env
 load_dotenv()
@@ -12,10 +15,63 @@ if not MONGO_URL:
 # --- Conexão com o banco MongoDB ---
 # O cliente é criado uma vez e reutilizado em toda a aplicação
 # para otimizar o número de conexões.
-client = AsyncIOMotorClient(MONGO_URL)
+# Os listeners medem a latência de cada comando enviado ao banco (ver app/metrics.py).
+client = AsyncIOMotorClient(MONGO_URL, event_listeners=metrics.mongo_listeners())
 database = client.eduzz
 user_collection: AsyncIOMotorCollection = database.users
+# Outbox dos webhooks: cada venda aceita é gravada aqui antes da resposta à Eduzz
+# e processada depois pelo worker em app/outbox.py.
+outbox_collection: AsyncIOMotorCollection = database.webhook_outbox
+# Configurações compartilhadas por todos os workers (ex.: custo calibrado do bcrypt).
+settings_collection: AsyncIOMotorCollection = database.app_settings
 
 def get_user_collection() -> AsyncIOMotorCollection:
     """Retorna a coleção de usuários do MongoDB."""
-    return user_collection
\ No newline at end of file
+    return user_collection
+
+def get_outbox_collection() -> AsyncIOMotorCollection:
+    """Retorna a coleção de outbox dos webhooks."""
+    return outbox_collection
+
+def get_settings_collection() -> AsyncIOMotorCollection:
+    """Retorna a coleção de configurações compartilhadas."""
+    return settings_collection
+
+# Quantos e-mails duplicados, no máximo, aparecem na mensagem de erro.
+DUPLICATE_EMAILS_REPORTED = 20
+
+async def find_duplicate_emails(limit: int = DUPLICATE_EMAILS_REPORTED) -> list:
+    """E-mails com mais de um usuário, com a quantidade de cada um (os mais repetidos primeiro)."""
+    pipeline = [
+        {"$group": {"_id": "$email", "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$sort": {"count": -1}},
+        {"$limit": limit},
+    ]
+    return await user_collection.aggregate(pipeline).to_list(limit)
+
+async def ensure_indexes() -> None:
+    """
+    Garante os índices usados pelas consultas da aplicação.
+    Chamado na inicialização (lifespan); create_indexes é idempotente.
+    """
+    # O índice único falha (E11000) se já houver e-mails repetidos. Na primeira criação,
+    # confere antes e para com uma mensagem que diz quais registros precisam ser unidos.
+    if "email_unique" not in await user_collection.index_information():
+        duplicates = await find_duplicate_emails()
+        if duplicates:
+            listed = ", ".join(f"{doc['_id']} ({doc['count']}x)" for doc in duplicates)
+            raise RuntimeError(
+                "Não foi possível criar o índice único de e-mail: a coleção de usuários tem e-mails "
+                f"duplicados. Remova ou una os registros repetidos e reinicie a aplicação: {listed}"
+            )
+    await user_collection.create_indexes([
+        # Login e verificação de idempotência buscam por e-mail; único para barrar duplicatas.
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+    ])
+    await outbox_collection.create_indexes([
+        # Busca de eventos pendentes e de leases expirados pelo worker.
+        IndexModel([("status", ASCENDING), ("available_at", ASCENDING)], name="status_available_at"),
+        IndexModel([("status", ASCENDING), ("claimed_at", ASCENDING)], name="status_claimed_at"),
+        IndexModel([("claim_token", ASCENDING)], sparse=True, name="claim_token"),
+    ])
@@ -1,12 +1,16 @@
 # app/email_service.py (VERSÃO COMPLETA E CORRIGIDA)
 
 import os
+import asyncio
 import logging
+from typing import List, Optional
 import aiosmtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from dotenv import load_dotenv
 
+from . import metrics
+
 # Carrega as variáveis de ambiente (essencial para o código funcionar)
 load_dotenv()
 
@@ -21,17 +25,115 @@ SMTP_USERNAME = os.getenv("SMTP_USERNAME")
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
 # ---> FIM DAS LINHAS ESSENCIAIS <---
 
+# TLS implícito (porta 465) por padrão; com "false" o aiosmtplib usa STARTTLS se o servidor oferecer.
+SMTP_USE_TLS = os.getenv("SMTP_USE_TLS", "true").lower() in ("1", "true", "yes")
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", 30))
+
+# --- Pool de conexões e fila de envio ---
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", 3))
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", 100))
+SMTP_SEND_CONCURRENCY = int(os.getenv("SMTP_SEND_CONCURRENCY", SMTP_POOL_SIZE))
+SMTP_MAX_RETRIES = int(os.getenv("SMTP_MAX_RETRIES", 3))
+SMTP_RETRY_BACKOFF = float(os.getenv("SMTP_RETRY_BACKOFF", 2.0)) # segundos, dobra a cada tentativa
+MAIL_QUEUE_MAXSIZE = int(os.getenv("MAIL_QUEUE_MAXSIZE", 10000))
+MAIL_SHUTDOWN_TIMEOUT = float(os.getenv("MAIL_SHUTDOWN_TIMEOUT", 30))
+
+
+def _smtp_configured() -> bool:
+    return all([SMTP_SERVER, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD])
+
+
+def _is_transient(exc: Exception) -> bool:
+    """Falhas de rede/timeout e respostas 4xx do servidor valem uma nova tentativa."""
+    if isinstance(exc, aiosmtplib.SMTPResponseException):
+        return 400 <= exc.code < 500
+    return isinstance(exc, (OSError, asyncio.TimeoutError))
 
-async def send_access_email(name: str, email: str, password: str):
+
+class _PooledConnection:
+    """Uma conexão SMTP autenticada e quantas mensagens já passaram por ela."""
+
+    def __init__(self):
+        self.smtp: Optional[aiosmtplib.SMTP] = None
+        self.sent = 0
+
+
+class SMTPConnectionPool:
     """
-    Monta e envia um e-mail com os dados de acesso para o comprador.
-    Esta versão usa uma conexão TLS implícita, ideal para a porta 465.
+    Mantém até `size` conexões SMTP autenticadas abertas e as reutiliza entre envios.
+    Conexões caídas ou que atingiram `max_messages` são reabertas na próxima utilização.
     """
-    # Esta verificação agora vai funcionar, pois as variáveis acima existem.
-    if not all([SMTP_SERVER, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD]):
-        logging.error("Variáveis de ambiente SMTP não configuradas. O e-mail não será enviado.")
-        return
 
+    def __init__(self, size: int = SMTP_POOL_SIZE, max_messages: int = SMTP_MAX_MESSAGES_PER_CONNECTION):
+        self.size = size
+        self.max_messages = max_messages
+        self._slots: asyncio.Queue = asyncio.Queue()
+        for _ in range(size):
+            self._slots.put_nowait(_PooledConnection())
+
+    async def _connect(self, conn: _PooledConnection) -> None:
+        await self._close(conn)
+        smtp = aiosmtplib.SMTP(
+            hostname=SMTP_SERVER, port=SMTP_PORT, use_tls=SMTP_USE_TLS, timeout=SMTP_TIMEOUT
+        )
+        with metrics.smtp_operation_duration.time("connect"):
+            await smtp.connect()
+        with metrics.smtp_operation_duration.time("login"):
+            await smtp.login(SMTP_USERNAME, SMTP_PASSWORD)
+        conn.smtp = smtp
+        conn.sent = 0
+
+    async def _close(self, conn: _PooledConnection) -> None:
+        if conn.smtp is None:
+            return
+        smtp, conn.smtp = conn.smtp, None
+        try:
+            if smtp.is_connected:
+                await smtp.quit()
+        except Exception:
+            smtp.close()
+
+    async def send(self, msg: MIMEMultipart) -> None:
+        """Envia a mensagem usando uma conexão livre do pool, reconectando se preciso."""
+        conn = await self._slots.get()
+        operation = "connect"
+        try:
+            if conn.smtp is None or not conn.smtp.is_connected or conn.sent >= self.max_messages:
+                await self._connect(conn)
+            operation = "send"
+            with metrics.smtp_operation_duration.time("send"):
+                await conn.smtp.send_message(msg)
+            conn.sent += 1
+        except Exception:
+            metrics.smtp_failures_total.inc(operation)
+            # Descarta a conexão: a próxima utilização do slot abre uma nova.
+            await self._close(conn)
+            raise
+        finally:
+            self._slots.put_nowait(conn)
+
+    async def close(self) -> None:
+        """Fecha todas as conexões (aguarda as que estão em uso serem devolvidas)."""
+        for _ in range(self.size):
+            conn = await self._slots.get()
+            await self._close(conn)
+            self._slots.put_nowait(conn)
+
+
+_pool: Optional[SMTPConnectionPool] = None
+_queue: Optional[asyncio.Queue] = None
+_workers: List[asyncio.Task] = []
+
+
+def _get_pool() -> SMTPConnectionPool:
+    global _pool
+    if _pool is None:
+        _pool = SMTPConnectionPool()
+    return _pool
+
+
+def build_access_message(name: str, email: str, password: str) -> MIMEMultipart:
+    """Monta o e-mail com os dados de acesso para o comprador."""
     body = f"""
     <html>
     <body>
@@ -53,13 +155,105 @@ async def send_access_email(name: str, email: str, password: str):
     msg['To'] = email
     msg['Subject'] = "Seus dados de acesso"
     msg.attach(MIMEText(body, 'html'))
+    return msg
 
-    try:
-        async with aiosmtplib.SMTP(hostname=SMTP_SERVER, port=SMTP_PORT, use_tls=True) as server:
-            await server.login(SMTP_USERNAME, SMTP_PASSWORD)
-            await server.send_message(msg)
-        
-        logging.info(f"E-mail de acesso enviado com sucesso para: {email}")
 
-    except Exception as e:
-        logging.error(f"Falha ao enviar e-mail para {email}: {e}")
\ No newline at end of file
+async def _deliver(msg: MIMEMultipart, email: str) -> bool:
+    """
+    Envia pelo pool, repetindo falhas temporárias com backoff exponencial.
+    Retorna True se o servidor SMTP aceitou a mensagem.
+    """
+    pool = _get_pool()
+    for attempt in range(SMTP_MAX_RETRIES + 1):
+        try:
+            await pool.send(msg)
+            logging.info(f"E-mail de acesso enviado com sucesso para: {email}")
+            return True
+        except Exception as e:
+            if attempt < SMTP_MAX_RETRIES and _is_transient(e):
+                delay = SMTP_RETRY_BACKOFF * (2 ** attempt)
+                logging.warning(f"Falha temporária ao enviar e-mail para {email} ({e}). Nova tentativa em {delay:.1f}s.")
+                await asyncio.sleep(delay)
+                continue
+            logging.error(f"Falha ao enviar e-mail para {email}: {e}")
+            return False
+
+
+def _resolve(sent: asyncio.Future, delivered: bool) -> None:
+    if not sent.done():
+        sent.set_result(delivered)
+
+
+async def _mail_worker() -> None:
+    while True:
+        msg, email, sent = await _queue.get()
+        try:
+            _resolve(sent, await _deliver(msg, email))
+        finally:
+            # Cancelado no meio do envio (desligamento): conta como não enviado.
+            _resolve(sent, False)
+            _queue.task_done()
+
+
+async def send_access_email(name: str, email: str, password: str) -> "asyncio.Future[bool]":
+    """
+    Monta o e-mail com os dados de acesso e o coloca na fila de envio.
+    Se a fila não estiver ativa (ex.: scripts fora da API), envia diretamente pelo pool.
+    Retorna um future que resolve para True quando o servidor SMTP aceitar a mensagem
+    e para False se o envio for desistido (ou a fila for encerrada antes dele).
+    """
+    sent = asyncio.get_running_loop().create_future()
+    # Esta verificação agora vai funcionar, pois as variáveis acima existem.
+    if not _smtp_configured():
+        logging.error("Variáveis de ambiente SMTP não configuradas. O e-mail não será enviado.")
+        sent.set_result(False)
+        return sent
+
+    msg = build_access_message(name, email, password)
+    if _queue is not None and _workers:
+        await _queue.put((msg, email, sent))
+    else:
+        sent.set_result(await _deliver(msg, email))
+    return sent
+
+
+def get_queue_depth() -> int:
+    """Quantidade de e-mails aguardando envio na fila."""
+    return _queue.qsize() if _queue is not None else 0
+
+metrics.Gauge("mail_queue_depth", "E-mails aguardando envio na fila.", func=get_queue_depth)
+
+
+async def start_mail_workers(concurrency: int = SMTP_SEND_CONCURRENCY) -> None:
+    """Cria a fila de envio e os workers que a consomem."""
+    global _queue
+    if _workers:
+        return
+    _queue = asyncio.Queue(maxsize=MAIL_QUEUE_MAXSIZE)
+    for _ in range(concurrency):
+        _workers.append(asyncio.create_task(_mail_worker()))
+
+
+async def stop_mail_workers(timeout: Optional[float] = MAIL_SHUTDOWN_TIMEOUT) -> None:
+    """
+    Aguarda a fila esvaziar (até `timeout` segundos; None espera o quanto for preciso),
+    encerra os workers e fecha o pool. Os e-mails que ficarem na fila resolvem como não enviados.
+    """
+    global _queue, _pool
+    if _queue is not None and _workers:
+        try:
+            await asyncio.wait_for(_queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Encerrando com {_queue.qsize()} e-mail(s) ainda na fila.")
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    while _queue is not None and not _queue.empty():
+        _, email, sent = _queue.get_nowait()
+        logging.error(f"E-mail de acesso para {email} não foi enviado antes do desligamento.")
+        _resolve(sent, False)
+    _queue = None
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
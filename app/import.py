@@ -0,0 +1,120 @@
+"""
+Importa compradores em lote a partir de um arquivo JSONL ou CSV.
+
+Uso:
+    python -m app.import compradores.csv
+    python -m app.import webhooks.jsonl --no-email
+    python -m app.import webhooks.jsonl --via-outbox
+    cat webhooks.jsonl | python -m app.import - --format jsonl
+
+JSONL: um payload do webhook da Eduzz por linha (event_name, cus_name, cus_email).
+CSV: cabeçalho com cus_name e cus_email (event_name é opcional; sem ele, a linha é uma venda paga).
+
+O arquivo é lido em streaming e gravado em lotes, então a memória não cresce com o tamanho da entrada.
+Sem --via-outbox, o comando só termina depois de tentar enviar todos os e-mails de acesso, e o resumo
+lista em unsent_emails os usuários criados que não receberam o e-mail.
+"""
+
+import io
+import sys
+import json
+import asyncio
+import functools
+import logging
+import argparse
+
+from .database import ensure_indexes
+from . import ingest
+from . import users
+from . import outbox
+from . import email_service
+from . import utils
+
+
+def _parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m app.import", description="Importa compradores em lote.")
+    parser.add_argument("path", help="arquivo JSONL/CSV, ou - para ler da entrada padrão")
+    parser.add_argument("--format", choices=ingest.FORMATS, help="padrão: pela extensão do arquivo (jsonl se não der)")
+    parser.add_argument("--chunk-size", type=int, default=ingest.IMPORT_CHUNK_SIZE, help="compradores por lote gravado")
+    parser.add_argument("--no-email", action="store_true", help="cria os usuários sem enviar o e-mail de acesso")
+    parser.add_argument("--via-outbox", action="store_true",
+                        help="só grava os eventos na outbox; a API cria os usuários e envia os e-mails")
+    return parser.parse_args(argv)
+
+
+def _record_delivery(summary: dict, email: str, sent: asyncio.Future) -> None:
+    if sent.cancelled() or not sent.result():
+        summary["unsent_emails"].append(email)
+
+
+async def _write_chunk(chunk, args: argparse.Namespace, summary: dict) -> None:
+    if args.via_outbox:
+        await outbox.enqueue_sales(chunk, send_email=not args.no_email)
+        return
+    created = await users.create_users(chunk)
+    summary["created"] += len(created)
+    if not args.no_email:
+        for user in created:
+            sent = await email_service.send_access_email(**user)
+            # Só as falhas ficam guardadas: o future é descartado assim que o envio termina.
+            sent.add_done_callback(functools.partial(_record_delivery, summary, user["email"]))
+
+
+async def run(args: argparse.Namespace) -> dict:
+    """Executa a importação e retorna o resumo."""
+    fmt = args.format or ("csv" if args.path.lower().endswith(".csv") else "jsonl")
+    sends_email = not args.no_email and not args.via_outbox
+
+    await ensure_indexes()
+    await utils.configure_rounds()
+    if sends_email:
+        await email_service.start_mail_workers()
+
+    summary = ingest.new_summary()
+    summary["created"] = 0
+    if sends_email:
+        summary["unsent_emails"] = []
+    chunker = ingest.Chunker(summary, args.chunk_size)
+    # utf-8-sig descarta o BOM que planilhas costumam gravar no início do CSV.
+    if args.path == "-":
+        stream = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig", newline="")
+    else:
+        stream = open(args.path, newline="", encoding="utf-8-sig")
+    try:
+        for line_no, raw in ingest.iter_rows(stream, fmt):
+            buyer = ingest.validate_row(raw, line_no, summary)
+            if buyer is None:
+                continue
+            chunk = chunker.add(buyer)
+            if chunk:
+                await _write_chunk(chunk, args, summary)
+                logging.info(f"Importação: {summary['received']} linha(s) lida(s), {summary['created']} usuário(s) criado(s).")
+        await _write_chunk(chunker.flush(), args, summary)
+    finally:
+        if args.path != "-":
+            stream.close()
+        if sends_email:
+            # Espera a fila inteira: a senha de quem não receber o e-mail não fica guardada em lugar nenhum.
+            await email_service.stop_mail_workers(timeout=None)
+            # Deixa rodar os callbacks dos últimos envios antes de ler o resumo.
+            await asyncio.sleep(0)
+            if summary["unsent_emails"]:
+                logging.error(
+                    f"{len(summary['unsent_emails'])} usuário(s) criado(s) sem receber o e-mail de acesso: "
+                    + ", ".join(summary["unsent_emails"])
+                )
+        utils.shutdown_executor()
+
+    if args.via_outbox:
+        del summary["created"]
+    return summary
+
+
+def main(argv=None) -> None:
+    args = _parse_args(argv)
+    summary = asyncio.run(run(args))
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
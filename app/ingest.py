@@ -0,0 +1,135 @@
+import os
+import csv
+import json
+import codecs
+from typing import AsyncIterator, Iterable, Iterator, List, Optional, Tuple, Union
+
+from dotenv import load_dotenv
+from pydantic import ValidationError
+
+from .models import EduzzWebhookPayload
+
+load_dotenv()
+
+# Tamanho dos lotes gravados de uma vez (insert_many / bulk upsert).
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", 500))
+# Quantos erros de validação são devolvidos no resumo (o total é sempre contado).
+MAX_REPORTED_ERRORS = 20
+
+FORMATS = ("jsonl", "csv")
+
+Buyer = Tuple[str, str]
+
+
+def new_summary() -> dict:
+    """Contadores de uma importação em lote."""
+    return {"received": 0, "accepted": 0, "ignored": 0, "invalid": 0, "duplicates": 0, "errors": []}
+
+
+def _record_error(summary: dict, line: int, message: str) -> None:
+    summary["invalid"] += 1
+    if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+        summary["errors"].append({"line": line, "error": message})
+
+
+def validate_row(raw: Union[str, dict], line: int, summary: dict) -> Optional[Buyer]:
+    """
+    Valida uma linha (texto JSON ou dicionário do CSV) com o EduzzWebhookPayload.
+    Retorna (nome, e-mail) das vendas pagas; linhas inválidas ou de outros eventos são contadas no resumo.
+    """
+    summary["received"] += 1
+    try:
+        if isinstance(raw, str):
+            row = json.loads(raw)
+        else:
+            # Exportações em CSV normalmente não têm a coluna do evento: são vendas pagas.
+            row = {key: value for key, value in raw.items() if value not in (None, "")}
+            row.setdefault("event_name", "invoice_paid")
+        payload = EduzzWebhookPayload(**row)
+    except ValidationError as e:
+        error = e.errors()[0]
+        _record_error(summary, line, f"{'.'.join(map(str, error['loc']))}: {error['msg']}")
+        return None
+    except (ValueError, TypeError) as e:
+        _record_error(summary, line, str(e))
+        return None
+
+    if payload.event_name != "invoice_paid":
+        summary["ignored"] += 1
+        return None
+    return payload.customer_name, payload.customer_email
+
+
+def iter_rows(lines: Iterable[str], fmt: str) -> Iterator[Tuple[int, Union[str, dict]]]:
+    """Percorre as linhas de um arquivo JSONL ou CSV (com cabeçalho) sem carregá-lo inteiro."""
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_no, line in enumerate(lines, start=1):
+        if line.strip():
+            yield line_no, line
+
+
+async def aiter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Quebra um corpo de requisição recebido em pedaços em linhas de texto."""
+    # utf-8-sig descarta o BOM que planilhas costumam gravar no início do CSV.
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer
+
+
+async def aiter_rows(lines: AsyncIterator[str], fmt: str) -> AsyncIterator[Tuple[int, Union[str, dict]]]:
+    """
+    Versão assíncrona de iter_rows para corpos de requisição.
+    No CSV, cada registro deve ocupar uma única linha.
+    """
+    header = None
+    line_no = 0
+    async for line in lines:
+        line_no += 1
+        if not line.strip():
+            continue
+        if fmt != "csv":
+            yield line_no, line
+            continue
+        values = next(csv.reader([line]))
+        if header is None:
+            header = values
+            continue
+        yield line_no, dict(zip(header, values))
+
+
+class Chunker:
+    """Agrupa compradores em lotes de até `size`, descartando e-mails repetidos dentro do lote."""
+
+    def __init__(self, summary: dict, size: int = IMPORT_CHUNK_SIZE):
+        self.summary = summary
+        self.size = size
+        self._buyers = {}
+
+    def add(self, buyer: Buyer) -> Optional[List[Buyer]]:
+        """Adiciona um comprador; retorna o lote quando ele fica cheio."""
+        name, email = buyer
+        if email in self._buyers:
+            self.summary["duplicates"] += 1
+            return None
+        self._buyers[email] = name
+        self.summary["accepted"] += 1
+        if len(self._buyers) >= self.size:
+            return self.flush()
+        return None
+
+    def flush(self) -> List[Buyer]:
+        """Retorna (e esvazia) o lote atual."""
+        chunk = [(name, email) for email, name in self._buyers.items()]
+        self._buyers = {}
+        return chunk
@@ -0,0 +1,159 @@
+import os
+import time
+import hmac
+import math
+import hashlib
+import secrets
+from collections import OrderedDict, deque
+from typing import Deque, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from . import metrics
+
+load_dotenv()
+
+# --- Cache de verificações bem-sucedidas ---
+# Um login repetido com a mesma senha dentro da janela não passa de novo pelo bcrypt.
+LOGIN_CACHE_SIZE = int(os.getenv("LOGIN_CACHE_SIZE", 10000))
+LOGIN_CACHE_TTL = float(os.getenv("LOGIN_CACHE_TTL", 300)) # segundos
+
+# --- Limite de falhas (janela deslizante) ---
+LOGIN_FAILURE_WINDOW = float(os.getenv("LOGIN_FAILURE_WINDOW", 900)) # segundos
+LOGIN_MAX_FAILURES_PER_EMAIL = int(os.getenv("LOGIN_MAX_FAILURES_PER_EMAIL", 5))
+# Desligado (0) por padrão: atrás de um proxy sem TRUSTED_PROXY_HOPS, todos os clientes
+# chegam com o IP do proxy e o limite barraria todo mundo de uma vez.
+LOGIN_MAX_FAILURES_PER_IP = int(os.getenv("LOGIN_MAX_FAILURES_PER_IP", 0))
+# Quantos proxies confiáveis (ex.: o balanceador do Render) ficam na frente da aplicação.
+# Com N > 0, o IP do cliente é o N-ésimo item, da direita para a esquerda, do X-Forwarded-For;
+# os itens mais à esquerda vêm do próprio cliente e podem ser forjados.
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", 0))
+# Máximo de e-mails/IPs acompanhados em memória; os mais antigos são descartados.
+LOGIN_TRACKED_KEYS_MAX = int(os.getenv("LOGIN_TRACKED_KEYS_MAX", 100000))
+
+# A senha nunca fica em memória: o cache guarda só um HMAC dela com uma chave deste processo.
+_cache_key = secrets.token_bytes(32)
+# e-mail -> (hmac da senha, hash armazenado no banco, expira_em)
+_verified: "OrderedDict[str, Tuple[bytes, str, float]]" = OrderedDict()
+_failures: "OrderedDict[str, Deque[float]]" = OrderedDict()
+
+stats = {
+    "cache_hits": 0,
+    "cache_misses": 0,
+    "throttled_email": 0,
+    "throttled_ip": 0,
+}
+
+
+class LoginThrottledError(Exception):
+    """Levantada quando o e-mail ou o IP excedeu o limite de falhas de login."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Muitas tentativas de login.")
+        self.retry_after = retry_after
+
+
+def client_ip(peer: Optional[str], forwarded_for: Optional[str]) -> Optional[str]:
+    """IP do cliente considerando TRUSTED_PROXY_HOPS (sem proxies, o endereço da conexão)."""
+    if TRUSTED_PROXY_HOPS <= 0:
+        return peer
+    hops = [hop.strip() for hop in (forwarded_for or "").split(",") if hop.strip()]
+    if len(hops) < TRUSTED_PROXY_HOPS:
+        # Cabeçalho mais curto que a cadeia de proxies: a requisição não passou por todos eles.
+        return peer
+    return hops[-TRUSTED_PROXY_HOPS]
+
+
+def _password_digest(password: str) -> bytes:
+    return hmac.new(_cache_key, password.encode("utf-8"), hashlib.sha256).digest()
+
+
+# --- Cache de verificação ---
+
+def is_cached(email: str, password: str, stored_hash: str) -> bool:
+    """
+    True se esta senha já foi verificada com sucesso contra o mesmo hash armazenado.
+    Se o hash no banco mudou, a entrada deixa de valer e é descartada.
+    """
+    entry = _verified.get(email)
+    if entry is not None:
+        digest, cached_hash, expires_at = entry
+        if cached_hash != stored_hash or expires_at <= time.monotonic():
+            del _verified[email]
+        elif hmac.compare_digest(digest, _password_digest(password)):
+            stats["cache_hits"] += 1
+            return True
+    stats["cache_misses"] += 1
+    return False
+
+def remember(email: str, password: str, stored_hash: str) -> None:
+    """Registra uma verificação bem-sucedida."""
+    _verified[email] = (_password_digest(password), stored_hash, time.monotonic() + LOGIN_CACHE_TTL)
+    _verified.move_to_end(email)
+    while len(_verified) > LOGIN_CACHE_SIZE:
+        _verified.popitem(last=False)
+
+def invalidate(email: str) -> None:
+    """Remove a verificação em cache do usuário (ex.: quando o hash da senha muda)."""
+    _verified.pop(email, None)
+
+
+# --- Limite de falhas ---
+
+def _recent_failures(key: str, now: float) -> Optional[Deque[float]]:
+    attempts = _failures.get(key)
+    if attempts is None:
+        return None
+    while attempts and attempts[0] <= now - LOGIN_FAILURE_WINDOW:
+        attempts.popleft()
+    if not attempts:
+        del _failures[key]
+        return None
+    return attempts
+
+def _check_key(key: str, limit: int, now: float) -> Optional[int]:
+    attempts = _recent_failures(key, now)
+    if attempts is None or len(attempts) < limit:
+        return None
+    return max(1, math.ceil(attempts[0] + LOGIN_FAILURE_WINDOW - now))
+
+def check_allowed(email: str, client_ip: Optional[str]) -> None:
+    """Rejeita (LoginThrottledError) antes de qualquer acesso ao banco ou ao bcrypt."""
+    now = time.monotonic()
+    retry_after = _check_key(f"email:{email}", LOGIN_MAX_FAILURES_PER_EMAIL, now)
+    if retry_after is not None:
+        stats["throttled_email"] += 1
+        raise LoginThrottledError(retry_after)
+    if client_ip and LOGIN_MAX_FAILURES_PER_IP > 0:
+        retry_after = _check_key(f"ip:{client_ip}", LOGIN_MAX_FAILURES_PER_IP, now)
+        if retry_after is not None:
+            stats["throttled_ip"] += 1
+            raise LoginThrottledError(retry_after)
+
+def record_failure(email: str, client_ip: Optional[str]) -> None:
+    now = time.monotonic()
+    keys = [f"email:{email}"] + ([f"ip:{client_ip}"] if client_ip and LOGIN_MAX_FAILURES_PER_IP > 0 else [])
+    for key in keys:
+        attempts = _failures.get(key)
+        if attempts is None:
+            attempts = _failures[key] = deque()
+        attempts.append(now)
+        _failures.move_to_end(key)
+    while len(_failures) > LOGIN_TRACKED_KEYS_MAX:
+        _failures.popitem(last=False)
+
+def record_success(email: str) -> None:
+    """Um login válido zera as falhas do e-mail (as do IP continuam contando)."""
+    _failures.pop(f"email:{email}", None)
+
+
+def get_stats() -> dict:
+    """Contadores do cache e do limitador, para observabilidade."""
+    return {**stats, "cache_size": len(_verified), "tracked_keys": len(_failures)}
+
+
+metrics.CallbackCounter("login_cache_hits_total", "Logins resolvidos pelo cache, sem bcrypt.", lambda: stats["cache_hits"])
+metrics.CallbackCounter("login_cache_misses_total", "Logins que precisaram do bcrypt.", lambda: stats["cache_misses"])
+metrics.CallbackCounter("login_throttled_email_total", "Logins barrados pelo limite por e-mail.", lambda: stats["throttled_email"])
+metrics.CallbackCounter("login_throttled_ip_total", "Logins barrados pelo limite por IP.", lambda: stats["throttled_ip"])
+metrics.Gauge("login_cache_size", "Verificações de login em cache.", func=lambda: len(_verified))
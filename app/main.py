@@ -1,16 +1,41 @@
-from fastapi import FastAPI, HTTPException, status, BackgroundTasks, Request, Response
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, HTTPException, status, BackgroundTasks, Request, Response, Depends
 from fastapi.middleware.cors import CORSMiddleware
-import logging # Importando logging para mensagens informativas
+from fastapi.responses import PlainTextResponse
 
-from .database import get_user_collection
+from .database import get_user_collection, ensure_indexes
 from .models import EduzzWebhookPayload, LoginRequest
 from . import utils
 from . import email_service
+from . import outbox
+from . import tokens
+from . import login_guard
+from . import users
+from . import ingest
+from . import metrics
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Inicializa e encerra os recursos compartilhados da aplicação."""
+    metrics.start_loop_monitor()
+    await ensure_indexes()
+    await utils.configure_rounds()
+    # Criação de usuários e rehash não podem ocupar as vagas do bcrypt reservadas ao login.
+    utils.reserve_login_slots()
+    await email_service.start_mail_workers()
+    await outbox.start_worker()
+    yield
+    await outbox.stop_worker()
+    await email_service.stop_mail_workers()
+    utils.shutdown_executor()
+    await metrics.stop_loop_monitor()
 
 app = FastAPI(
     title="API Eduzz Webhook",
     description="API para processar webhooks de vendas da Eduzz e autenticar usuários.",
-    version="2.1.0" # Versão Idempotente
+    version="2.1.0", # Versão Idempotente
+    lifespan=lifespan
 )
 
 # ... (código do CORS e da instância do app continua igual) ...
@@ -23,74 +48,135 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-user_collection = get_user_collection()
+# Mede duração e status de cada requisição por rota (desligável com METRICS_ENABLED=false).
+app.add_middleware(metrics.MetricsMiddleware)
 
-# --- FUNÇÃO DE BACKGROUND ATUALIZADA ---
-async def process_sale_in_background(name: str, email: str):
-    """
-    Cria o usuário e envia e-mail, mas ANTES verifica se o usuário já existe.
-    """
-    # VERIFICAÇÃO DE IDEMPOTÊNCIA: O usuário já existe?
-    existing_user = await user_collection.find_one({"email": email})
-    if existing_user:
-        logging.info(f"Usuário com e-mail {email} já existe. Ignorando a criação duplicada.")
-        return  # Para a execução aqui se o usuário já foi criado.
-
-    # Se o código continuar, significa que o usuário é novo.
-    random_password = utils.generate_random_password()
-    hashed_password = utils.hash_password(random_password)
-    
-    user_document = {
-        "name": name,
-        "email": email,
-        "password": hashed_password
-    }
-
-    await user_collection.insert_one(user_document)
-
-    await email_service.send_access_email(
-        name=name, 
-        email=email, 
-        password=random_password
-    )
+user_collection = get_user_collection()
 
 @app.post("/eduzz/webhook")
-async def eduzz_webhook(payload: EduzzWebhookPayload, background_tasks: BackgroundTasks):
+async def eduzz_webhook(payload: EduzzWebhookPayload):
     """
-    Recebe o webhook, responde imediatamente e processa a venda em segundo plano.
+    Recebe o webhook, grava a venda na outbox e responde imediatamente.
+    A criação do usuário e o e-mail ficam com o worker da outbox (app/outbox.py),
+    então nenhuma venda aceita se perde se o processo reiniciar.
     Atualizado para a nova estrutura de webhooks da Eduzz (usando event_name).
     """
     # Verificando o campo 'event_name' e o valor 'invoice_paid'
     if payload.event_name != "invoice_paid":
         return {"status": "event_ignored", "event": payload.event_name}
     
-    background_tasks.add_task(
-        process_sale_in_background, 
-        payload.customer_name, 
-        payload.customer_email
-    )
+    await outbox.enqueue_sale(payload.customer_name, payload.customer_email)
     
     return {"status": "success - processing in background"}
 
+@app.post("/eduzz/webhook/batch", dependencies=[Depends(tokens.require_import_token)])
+async def eduzz_webhook_batch(request: Request, format: Optional[str] = None, send_email: bool = True):
+    """
+    Recebe muitas vendas de uma vez (backfill de exportações ou reenvio de webhooks perdidos).
+    O corpo é lido em streaming, em JSONL (um payload do webhook por linha) ou CSV com
+    cabeçalho (cus_name, cus_email e, opcionalmente, event_name). As linhas válidas vão
+    para a outbox em lotes; com send_email=false os usuários são criados sem e-mail.
+    Exige "Authorization: Bearer <IMPORT_API_TOKEN>".
+    """
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "jsonl")
+    if fmt not in ingest.FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"status": "invalid_format", "formats": list(ingest.FORMATS)}
+        )
+
+    summary = ingest.new_summary()
+    chunker = ingest.Chunker(summary)
+    async for line_no, raw in ingest.aiter_rows(ingest.aiter_lines(request.stream()), fmt):
+        buyer = ingest.validate_row(raw, line_no, summary)
+        if buyer is None:
+            continue
+        chunk = chunker.add(buyer)
+        if chunk:
+            await outbox.enqueue_sales(chunk, send_email=send_email)
+    await outbox.enqueue_sales(chunker.flush(), send_email=send_email)
+
+    return {"status": "success - processing in background", **summary}
+
 # ... (o resto do código, como /auth/login, continua o mesmo) ...
 @app.post("/auth/login")
-async def auth_login(login_data: LoginRequest):
+async def auth_login(login_data: LoginRequest, request: Request, background_tasks: BackgroundTasks):
+    client_ip = login_guard.client_ip(
+        request.client.host if request.client else None, request.headers.get("x-forwarded-for")
+    )
     try:
-        user = await user_collection.find_one({"email": login_data.email})
-        if not user or not utils.verify_password(login_data.password, user["password"]):
+        # Quem já errou demais é barrado antes de qualquer consulta ou bcrypt.
+        login_guard.check_allowed(login_data.email, client_ip)
+
+        user = await user_collection.find_one({"email": login_data.email}, {"password": 1, "token_version": 1})
+        if user and login_guard.is_cached(login_data.email, login_data.password, user["password"]):
+            valid = True
+        else:
+            valid = bool(user) and await utils.verify_password_async(login_data.password, user["password"])
+            if valid:
+                login_guard.remember(login_data.email, login_data.password, user["password"])
+
+        if not valid:
+            login_guard.record_failure(login_data.email, client_ip)
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail={"status": "invalid_credentials"}
             )
-        return {"status": "success"}
+        login_guard.record_success(login_data.email)
+
+        # Hash gerado com outro custo do bcrypt: atualiza depois da resposta, sem forçar troca de senha.
+        if utils.needs_rehash(user["password"]):
+            background_tasks.add_task(users.rehash_password, login_data.email, login_data.password, user["password"])
+
+        # Token de sessão: o cliente o reenvia em vez das credenciais, sem passar de novo pelo bcrypt.
+        token_version = user.get("token_version", 0)
+        tokens.remember_token_version(login_data.email, token_version)
+        access_token, _ = tokens.create_token(login_data.email, token_version)
+        return {
+            "status": "success",
+            "access_token": access_token,
+            "token_type": "bearer",
+            "expires_in": tokens.AUTH_TOKEN_TTL
+        }
     except HTTPException as http_exc:
         raise http_exc
+    except login_guard.LoginThrottledError as throttled_exc:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail={"status": "too_many_attempts"},
+            headers={"Retry-After": str(throttled_exc.retry_after)}
+        )
+    except utils.HashingBusyError as busy_exc:
+        # Pool de bcrypt saturado: responde rápido para o cliente tentar de novo.
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={"status": "busy"},
+            headers={"Retry-After": str(busy_exc.retry_after)}
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail={"status": "error", "message": str(e)}
         )
 
+@app.get("/auth/verify")
+async def auth_verify(claims: dict = Depends(tokens.get_current_user)):
+    """Valida o token de sessão apenas em CPU (sem bcrypt e, com o cache quente, sem banco)."""
+    return {"status": "valid", "email": claims["sub"], "expires_at": claims["exp"]}
+
+@app.post("/auth/logout")
+async def auth_logout(claims: dict = Depends(tokens.get_current_user)):
+    """Revoga todos os tokens emitidos para o usuário."""
+    await tokens.revoke_tokens(claims["sub"])
+    return {"status": "logged_out"}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    """Métricas da aplicação no formato do Prometheus."""
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.api_route("/", methods=["GET", "HEAD"], include_in_schema=False)
 def root(request: Request):
     if request.method == "HEAD":
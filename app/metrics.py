@@ -0,0 +1,305 @@
+import os
+import time
+import asyncio
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+from pymongo import monitoring
+
+load_dotenv()
+
+# --- Configuração das métricas ---
+# Com METRICS_ENABLED=false nada é medido e a rota /metrics responde 404.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+EVENT_LOOP_LAG_INTERVAL = float(os.getenv("EVENT_LOOP_LAG_INTERVAL", 0.5)) # segundos
+
+# Faixas (em segundos) dos histogramas de latência.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry: List["_Metric"] = []
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [
+        name + '="' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+        for name, value in zip(labelnames, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Mongo e o pool de bcrypt (modo thread) atualizam métricas fora do event loop.
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        return "\n".join(lines + self._samples())
+
+
+class Counter(_Metric):
+    """Contador que só cresce."""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in items]
+
+
+class Gauge(_Metric):
+    """Valor que sobe e desce; com `func`, é lido na hora da coleta."""
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 func: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._func = func
+
+    def set(self, value: float, *labels: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def _samples(self) -> List[str]:
+        if self._func is not None:
+            return [f"{self.name} {_format_value(self._func())}"]
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in items]
+
+
+class CallbackCounter(Counter):
+    """Contador mantido por outro módulo e lido na hora da coleta."""
+
+    def __init__(self, name: str, documentation: str, func: Callable[[], float]):
+        super().__init__(name, documentation)
+        self._func = func
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name} {_format_value(self._func())}"]
+
+
+class _Timer:
+    __slots__ = ("_histogram", "_labels", "_started")
+
+    def __init__(self, histogram: "Histogram", labels: Tuple[str, ...]):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._histogram.observe(time.perf_counter() - self._started, *self._labels)
+        return False
+
+
+class Histogram(_Metric):
+    """Distribuição de valores (latências) em faixas cumulativas."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [contagem por faixa (+Inf no fim), soma]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def time(self, *labels: str) -> _Timer:
+        """Context manager que mede a duração do bloco."""
+        return _Timer(self, labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        samples = []
+        for labels, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _format_labels(self.labelnames, labels, 'le="' + le + '"')
+                samples.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            samples.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {repr(total)}")
+            samples.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return samples
+
+
+def render() -> str:
+    """Todas as métricas no formato texto do Prometheus."""
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+# --- Métricas compartilhadas ---
+
+http_requests_total = Counter("http_requests_total", "Requisições HTTP atendidas.", ("method", "route", "status"))
+http_request_duration = Histogram("http_request_duration_seconds", "Duração das requisições HTTP.", ("method", "route"))
+http_requests_in_progress = Gauge("http_requests_in_progress", "Requisições HTTP em andamento.")
+
+bcrypt_duration = Histogram(
+    "bcrypt_duration_seconds", "Duração das operações bcrypt, incluindo a espera no pool.", ("operation",),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+bcrypt_in_flight = Gauge("bcrypt_in_flight", "Operações bcrypt em andamento (rodando ou na fila do pool).")
+bcrypt_rejected_total = Counter("bcrypt_rejected_total", "Operações bcrypt recusadas com o pool saturado.")
+
+mongo_command_duration = Histogram("mongo_command_duration_seconds", "Duração dos comandos MongoDB.", ("collection", "command"))
+mongo_command_failures_total = Counter("mongo_command_failures_total", "Comandos MongoDB que falharam.", ("collection", "command"))
+
+smtp_operation_duration = Histogram("smtp_operation_duration_seconds", "Duração das operações SMTP.", ("operation",))
+smtp_failures_total = Counter("smtp_failures_total", "Operações SMTP que falharam.", ("operation",))
+
+background_task_duration = Histogram("background_task_duration_seconds", "Duração das tarefas em segundo plano.", ("task",))
+background_tasks_in_progress = Gauge("background_tasks_in_progress", "Tarefas em segundo plano em execução.", ("task",))
+
+event_loop_lag = Histogram(
+    "event_loop_lag_seconds", "Atraso do event loop em relação ao agendado.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+
+# --- Instrumentação do MongoDB ---
+
+class _MongoCommandListener(monitoring.CommandListener):
+    """Mede todos os comandos enviados pelo cliente (find_one, bulk_write, cursores...)."""
+
+    def __init__(self):
+        self._collections: Dict[Tuple, str] = {}
+
+    @staticmethod
+    def _key(event) -> Tuple:
+        return (event.connection_id, event.request_id)
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = event.command.get("collection", "")
+        self._collections[self._key(event)] = collection
+
+    def succeeded(self, event):
+        collection = self._collections.pop(self._key(event), "")
+        mongo_command_duration.observe(event.duration_micros / 1e6, collection, event.command_name)
+
+    def failed(self, event):
+        collection = self._collections.pop(self._key(event), "")
+        mongo_command_duration.observe(event.duration_micros / 1e6, collection, event.command_name)
+        mongo_command_failures_total.inc(collection, event.command_name)
+
+
+def mongo_listeners() -> list:
+    """Listeners para passar ao AsyncIOMotorClient (vazio com as métricas desligadas)."""
+    return [_MongoCommandListener()] if METRICS_ENABLED else []
+
+
+# --- Middleware HTTP ---
+
+class MetricsMiddleware:
+    """Middleware ASGI que conta e mede as requisições por rota (o template, não o caminho)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        http_requests_in_progress.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_progress.dec()
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            http_request_duration.observe(time.perf_counter() - started, scope["method"], path)
+            http_requests_total.inc(scope["method"], path, str(status_code))
+
+
+# --- Atraso do event loop ---
+
+_loop_monitor: Optional[asyncio.Task] = None
+
+
+async def _monitor_event_loop() -> None:
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(EVENT_LOOP_LAG_INTERVAL)
+        event_loop_lag.observe(max(0.0, time.perf_counter() - started - EVENT_LOOP_LAG_INTERVAL))
+
+
+def start_loop_monitor() -> None:
+    """Inicia a medição periódica do atraso do event loop."""
+    global _loop_monitor
+    if METRICS_ENABLED and _loop_monitor is None:
+        _loop_monitor = asyncio.create_task(_monitor_event_loop())
+
+
+async def stop_loop_monitor() -> None:
+    global _loop_monitor
+    if _loop_monitor is not None:
+        _loop_monitor.cancel()
+        await asyncio.gather(_loop_monitor, return_exceptions=True)
+        _loop_monitor = None
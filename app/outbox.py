@@ -0,0 +1,283 @@
+import os
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+
+from .database import get_outbox_collection
+from . import users
+from . import email_service
+from . import metrics
+
+load_dotenv()
+
+# --- Configuração do worker da outbox ---
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 50))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 1.0)) # segundos
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 5))
+OUTBOX_RETRY_BACKOFF = float(os.getenv("OUTBOX_RETRY_BACKOFF", 30)) # segundos, dobra a cada tentativa
+# Eventos "processing" há mais tempo que isso (ex.: worker reiniciado) voltam a ser reivindicáveis.
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", 300))
+OUTBOX_SHUTDOWN_TIMEOUT = float(os.getenv("OUTBOX_SHUTDOWN_TIMEOUT", 30))
+
+outbox_collection = get_outbox_collection()
+
+_worker: Optional[asyncio.Task] = None
+_wakeup: Optional[asyncio.Event] = None
+_stopping = False
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _pending_filter(now: datetime) -> dict:
+    return {"status": "pending", "available_at": {"$lte": now}}
+
+
+def _expired_filter(now: datetime) -> dict:
+    return {"status": "processing", "claimed_at": {"$lt": now - timedelta(seconds=OUTBOX_LEASE_SECONDS)}}
+
+
+def _claimable_filter(now: datetime) -> dict:
+    return {"$or": [_pending_filter(now), _expired_filter(now)]}
+
+
+def _new_event(name: str, email: str, event_name: str, send_email: bool, now: datetime) -> dict:
+    return {
+        "event_name": event_name,
+        "name": name,
+        "email": email,
+        "send_email": send_email,
+        "status": "pending",
+        "attempts": 0,
+        "created_at": now,
+        "available_at": now,
+    }
+
+
+def _wake_worker() -> None:
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+async def enqueue_sale(name: str, email: str, event_name: str = "invoice_paid") -> None:
+    """Grava a venda na outbox. É a única escrita feita antes de responder ao webhook."""
+    await outbox_collection.insert_one(_new_event(name, email, event_name, True, _now()))
+    _wake_worker()
+
+
+async def enqueue_sales(buyers: List[Tuple[str, str]], send_email: bool = True) -> None:
+    """Grava um lote de vendas na outbox com um único insert_many (importações e reenvios)."""
+    if not buyers:
+        return
+    now = _now()
+    await outbox_collection.insert_many(
+        [_new_event(name, email, "invoice_paid", send_email, now) for name, email in buyers],
+        ordered=False,
+    )
+    _wake_worker()
+
+
+async def _claim_batch() -> List[dict]:
+    """
+    Reivindica até OUTBOX_BATCH_SIZE eventos para este worker.
+    Os update_many reaplicam o filtro documento a documento, então um evento
+    já reivindicado por outro worker não é pego duas vezes.
+    Um lease expirado conta como tentativa falha (o worker anterior caiu ou travou no
+    evento); ao atingir OUTBOX_MAX_ATTEMPTS o evento vai para "failed" em vez de voltar ao lote.
+    """
+    now = _now()
+    candidates = await outbox_collection.find(
+        _claimable_filter(now), {"_id": 1, "status": 1}
+    ).sort("available_at", 1).limit(OUTBOX_BATCH_SIZE).to_list(OUTBOX_BATCH_SIZE)
+    if not candidates:
+        return []
+
+    claim_token = uuid.uuid4().hex
+    claim = {"status": "processing", "claim_token": claim_token, "claimed_at": now}
+    pending_ids = [doc["_id"] for doc in candidates if doc["status"] == "pending"]
+    expired_ids = [doc["_id"] for doc in candidates if doc["status"] == "processing"]
+    if pending_ids:
+        await outbox_collection.update_many(
+            {"_id": {"$in": pending_ids}, **_pending_filter(now)}, {"$set": claim}
+        )
+    if expired_ids:
+        await outbox_collection.update_many(
+            {"_id": {"$in": expired_ids}, **_expired_filter(now)},
+            {"$set": {**claim, "last_error": "Lease expirado antes do fim do processamento."}, "$inc": {"attempts": 1}},
+        )
+    events = await outbox_collection.find({"claim_token": claim_token}).to_list(None)
+
+    exhausted = [event for event in events if event.get("attempts", 0) >= OUTBOX_MAX_ATTEMPTS]
+    if exhausted:
+        await outbox_collection.update_many(
+            {"_id": {"$in": [event["_id"] for event in exhausted]}, "claim_token": claim_token},
+            {"$set": {"status": "failed"}, "$unset": {"claim_token": ""}},
+        )
+        for event in exhausted:
+            logging.error(
+                f"Evento de venda para {event['email']} falhou {event['attempts']} vezes e foi desistido: "
+                f"{event.get('last_error')}"
+            )
+    return [event for event in events if event.get("attempts", 0) < OUTBOX_MAX_ATTEMPTS]
+
+
+async def _mark_for_retry(events: List[dict], error: str) -> None:
+    now = _now()
+    operations = []
+    for event in events:
+        attempts = event.get("attempts", 0) + 1
+        if attempts >= OUTBOX_MAX_ATTEMPTS:
+            update = {"status": "failed", "attempts": attempts, "last_error": error}
+            logging.error(f"Evento de venda para {event['email']} falhou {attempts} vezes e foi desistido: {error}")
+        else:
+            delay = OUTBOX_RETRY_BACKOFF * (2 ** (attempts - 1))
+            update = {
+                "status": "pending",
+                "attempts": attempts,
+                "last_error": error,
+                "available_at": now + timedelta(seconds=delay),
+            }
+        # Só mexe no evento se este worker ainda for o dono do claim.
+        operations.append(UpdateOne(
+            {"_id": event["_id"], "claim_token": event["claim_token"]},
+            {"$set": update, "$unset": {"claim_token": ""}},
+        ))
+    await outbox_collection.bulk_write(operations, ordered=False)
+
+
+async def _renew_lease(claim_token: str) -> None:
+    """
+    Renova o lease do lote enquanto ele é processado: a espera pelos envios (retries e
+    SMTP_TIMEOUT durante uma instabilidade do SMTP) pode passar de OUTBOX_LEASE_SECONDS.
+    Se o processo travar ou cair, a renovação para junto e o lease expira normalmente.
+    """
+    while True:
+        await asyncio.sleep(OUTBOX_LEASE_SECONDS / 3)
+        try:
+            await outbox_collection.update_many({"claim_token": claim_token}, {"$set": {"claimed_at": _now()}})
+        except Exception as e:
+            logging.error(f"Falha ao renovar o lease do lote da outbox: {e}")
+
+
+async def _process_batch(events: List[dict]) -> None:
+    """
+    Cria os usuários do lote, envia os e-mails de acesso e finaliza os eventos.
+    Um evento só vira "done" depois que o servidor SMTP aceita o e-mail. Até lá ele fica
+    com mail_pending, e uma nova tentativa gera outra senha (a anterior só existiu em
+    memória) e reenvia o e-mail.
+    """
+    claim_token = events[0]["claim_token"]
+    wants_email = {event["email"] for event in events if event.get("send_email", True)}
+    resend = [event for event in events if event.get("mail_pending")]
+    try:
+        # Antes de criar os usuários, marca os eventos que ficam responsáveis pelo e-mail de
+        # acesso: se o processo cair depois do upsert, a nova tentativa sabe que deve reenviar.
+        existing = await users.find_existing(
+            {event["email"] for event in events if event["email"] in wants_email and not event.get("mail_pending")}
+        )
+        claimed = [
+            event for event in events
+            if event["email"] in wants_email and not event.get("mail_pending") and event["email"] not in existing
+        ]
+        if claimed:
+            result = await outbox_collection.update_many(
+                {"_id": {"$in": [event["_id"] for event in claimed]}, "claim_token": claim_token},
+                {"$set": {"mail_pending": True}},
+            )
+            if result.matched_count < len(claimed):
+                logging.warning("Lote da outbox reivindicado por outro worker; abandonando este processamento.")
+                return
+
+        created = await users.create_users((event["name"], event["email"]) for event in events)
+        created_emails = {user["email"] for user in created}
+        reset = await users.reset_passwords(
+            (event["name"], event["email"]) for event in resend if event["email"] not in created_emails
+        )
+    except Exception as e:
+        logging.error(f"Falha ao processar lote de {len(events)} venda(s): {e}")
+        await _mark_for_retry(events, str(e))
+        return
+
+    # Eventos de importação podem pedir para não enviar o e-mail de acesso.
+    sending = {}
+    for user in created + reset:
+        if user["email"] in wants_email:
+            sending[user["email"]] = await email_service.send_access_email(**user)
+    delivered = dict(zip(sending, await asyncio.gather(*sending.values())))
+
+    undelivered = [event for event in events if event["email"] in wants_email and delivered.get(event["email"]) is False]
+    undelivered_ids = {event["_id"] for event in undelivered}
+    finished = [event for event in events if event["_id"] not in undelivered_ids]
+    if finished:
+        result = await outbox_collection.update_many(
+            {"_id": {"$in": [event["_id"] for event in finished]}, "claim_token": claim_token},
+            {"$set": {"status": "done", "processed_at": _now()}, "$unset": {"claim_token": "", "mail_pending": ""}},
+        )
+        if result.matched_count < len(finished):
+            logging.warning(
+                f"{len(finished) - result.matched_count} evento(s) do lote foram reivindicados por outro worker "
+                "antes de serem finalizados; o estado deles fica com o novo dono."
+            )
+    if undelivered:
+        await _mark_for_retry(undelivered, "E-mail de acesso não enviado.")
+    logging.info(
+        f"Lote da outbox processado: {len(events)} evento(s), {len(created)} usuário(s) criado(s), "
+        f"{len(reset)} senha(s) regerada(s), {len(undelivered)} e-mail(s) não enviado(s)."
+    )
+
+
+async def _run_worker() -> None:
+    while not _stopping:
+        _wakeup.clear()
+        try:
+            events = await _claim_batch()
+            if events:
+                metrics.background_tasks_in_progress.inc("outbox_batch")
+                renewal = asyncio.create_task(_renew_lease(events[0]["claim_token"]))
+                try:
+                    with metrics.background_task_duration.time("outbox_batch"):
+                        await _process_batch(events)
+                finally:
+                    renewal.cancel()
+                    metrics.background_tasks_in_progress.dec("outbox_batch")
+                continue
+        except Exception as e:
+            # Eventos reivindicados e não finalizados voltam à fila quando o lease expirar.
+            logging.error(f"Falha no worker da outbox: {e}")
+
+        # Nada a fazer: espera um novo evento deste processo ou o próximo ciclo de polling.
+        try:
+            await asyncio.wait_for(_wakeup.wait(), OUTBOX_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def start_worker() -> None:
+    """Inicia o worker da outbox no event loop atual."""
+    global _worker, _wakeup, _stopping
+    if _worker is not None:
+        return
+    _stopping = False
+    _wakeup = asyncio.Event()
+    _worker = asyncio.create_task(_run_worker())
+
+
+async def stop_worker(timeout: float = OUTBOX_SHUTDOWN_TIMEOUT) -> None:
+    """Deixa o lote atual terminar (até `timeout` segundos) e encerra o worker."""
+    global _worker, _stopping
+    if _worker is None:
+        return
+    _stopping = True
+    _wakeup.set()
+    try:
+        await asyncio.wait_for(_worker, timeout)
+    except asyncio.TimeoutError:
+        # O lote interrompido volta a ser processado quando o lease expirar.
+        logging.warning("Worker da outbox cancelado antes de concluir o lote atual.")
+    _worker = None
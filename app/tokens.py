@@ -0,0 +1,148 @@
+import os
+import time
+import json
+import hmac
+import base64
+import hashlib
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import Header, HTTPException, status
+
+from .database import get_user_collection
+
+load_dotenv()
+
+# --- Configuração dos tokens de sessão ---
+# Tokens assinados com HMAC-SHA256: a validação é só CPU, sem banco e sem bcrypt.
+AUTH_TOKEN_SECRET = os.getenv("AUTH_TOKEN_SECRET")
+if not AUTH_TOKEN_SECRET:
+    raise ValueError("A variável de ambiente AUTH_TOKEN_SECRET não foi definida.")
+
+AUTH_TOKEN_TTL = int(os.getenv("AUTH_TOKEN_TTL", 86400)) # segundos (24h)
+# Por quanto tempo a versão de token de um usuário fica em cache antes de ser relida do banco.
+# Também é o atraso máximo para uma revogação feita em outro processo ter efeito aqui.
+TOKEN_VERSION_CACHE_TTL = float(os.getenv("TOKEN_VERSION_CACHE_TTL", 60))
+TOKEN_VERSION_CACHE_SIZE = int(os.getenv("TOKEN_VERSION_CACHE_SIZE", 10000))
+
+# Token compartilhado das rotas administrativas (importação em lote). Sem ele, essas rotas ficam desativadas.
+IMPORT_API_TOKEN = os.getenv("IMPORT_API_TOKEN")
+
+_secret = AUTH_TOKEN_SECRET.encode("utf-8")
+# e-mail -> (token_version, expira_em)
+_version_cache: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+
+user_collection = get_user_collection()
+
+
+class InvalidTokenError(Exception):
+    """Token malformado, com assinatura inválida, expirado ou revogado."""
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(_secret, payload.encode("ascii"), hashlib.sha256).digest())
+
+
+def create_token(email: str, token_version: int = 0) -> Tuple[str, int]:
+    """Gera um token assinado para o usuário. Retorna o token e o instante de expiração (epoch)."""
+    expires_at = int(time.time()) + AUTH_TOKEN_TTL
+    claims = {"sub": email, "ver": token_version, "exp": expires_at}
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+    return f"{payload}.{_sign(payload)}", expires_at
+
+def decode_token(token: str) -> dict:
+    """Valida assinatura e expiração do token e retorna as claims. Não acessa o banco."""
+    try:
+        payload, signature = token.split(".")
+        if not hmac.compare_digest(signature, _sign(payload)):
+            raise InvalidTokenError("Assinatura inválida.")
+        claims = json.loads(_b64decode(payload))
+    except InvalidTokenError:
+        raise
+    except Exception:
+        raise InvalidTokenError("Token malformado.")
+
+    if claims.get("exp", 0) < time.time():
+        raise InvalidTokenError("Token expirado.")
+    return claims
+
+
+# --- Versão de token (revogação) ---
+
+def remember_token_version(email: str, token_version: int) -> None:
+    """Guarda a versão de token do usuário no cache local."""
+    _version_cache[email] = (token_version, time.monotonic() + TOKEN_VERSION_CACHE_TTL)
+    _version_cache.move_to_end(email)
+    while len(_version_cache) > TOKEN_VERSION_CACHE_SIZE:
+        _version_cache.popitem(last=False)
+
+async def get_token_version(email: str) -> Optional[int]:
+    """Versão de token atual do usuário; só consulta o banco quando o cache expirou."""
+    cached = _version_cache.get(email)
+    if cached is not None and cached[1] > time.monotonic():
+        return cached[0]
+
+    user = await user_collection.find_one({"email": email}, {"token_version": 1})
+    if not user:
+        _version_cache.pop(email, None)
+        return None
+    token_version = user.get("token_version", 0)
+    remember_token_version(email, token_version)
+    return token_version
+
+async def revoke_tokens(email: str) -> None:
+    """Invalida todos os tokens já emitidos para o usuário."""
+    await user_collection.update_one({"email": email}, {"$inc": {"token_version": 1}})
+    _version_cache.pop(email, None)
+
+
+async def verify_token(token: str) -> dict:
+    """Valida o token e confere se ele não foi revogado. Retorna as claims."""
+    claims = decode_token(token)
+    if await get_token_version(claims["sub"]) != claims.get("ver"):
+        raise InvalidTokenError("Token revogado.")
+    return claims
+
+
+async def get_current_user(authorization: Optional[str] = Header(None)) -> dict:
+    """
+    Dependência do FastAPI para rotas autenticadas.
+    Espera o cabeçalho "Authorization: Bearer <token>" e retorna as claims do token.
+    """
+    scheme, _, token = (authorization or "").partition(" ")
+    try:
+        if scheme.lower() != "bearer" or not token:
+            raise InvalidTokenError("Cabeçalho Authorization ausente.")
+        return await verify_token(token)
+    except InvalidTokenError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail={"status": "invalid_token"},
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+
+
+async def require_import_token(authorization: Optional[str] = Header(None)) -> None:
+    """
+    Dependência do FastAPI para as rotas de importação.
+    Espera o cabeçalho "Authorization: Bearer <IMPORT_API_TOKEN>".
+    """
+    if not IMPORT_API_TOKEN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail={"status": "import_disabled"}
+        )
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode("utf-8"), IMPORT_API_TOKEN.encode("utf-8")):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail={"status": "invalid_token"},
+            headers={"WWW-Authenticate": "Bearer"}
+        )
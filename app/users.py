@@ -0,0 +1,130 @@
+import asyncio
+import logging
+from typing import Iterable, List, Set, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from .database import get_user_collection
+from . import utils
+from . import login_guard
+from . import metrics
+
+user_collection = get_user_collection()
+
+DUPLICATE_KEY_ERROR = 11000
+
+# E-mails com rehash em andamento, para não refazer o mesmo hash em logins simultâneos.
+_rehashing = set()
+
+
+async def find_existing(emails: Iterable[str]) -> Set[str]:
+    """E-mails, dentre os informados, que já têm usuário (uma única consulta)."""
+    emails = list(emails)
+    if not emails:
+        return set()
+    return {doc["email"] async for doc in user_collection.find({"email": {"$in": emails}}, {"email": 1, "_id": 0})}
+
+
+async def create_users(buyers: Iterable[Tuple[str, str]]) -> List[dict]:
+    """
+    Cria, em lote, os usuários (nome, e-mail) que ainda não existem.
+    Retorna nome, e-mail e senha em texto puro dos usuários criados,
+    para que o e-mail de acesso possa ser enviado.
+    """
+    # Um e-mail repetido no mesmo lote gera um único usuário.
+    pending = {}
+    for name, email in buyers:
+        pending.setdefault(email, name)
+    if not pending:
+        return []
+
+    # VERIFICAÇÃO DE IDEMPOTÊNCIA: uma única consulta para o lote inteiro.
+    for email in await find_existing(pending):
+        logging.info(f"Usuário com e-mail {email} já existe. Ignorando a criação duplicada.")
+        pending.pop(email, None)
+    if not pending:
+        return []
+
+    passwords = {email: utils.generate_random_password() for email in pending}
+    hashes = await asyncio.gather(*(utils.hash_password_async(password) for password in passwords.values()))
+
+    # Upsert com $setOnInsert: cria o usuário de forma atômica e nunca sobrescreve
+    # um existente, mesmo que um webhook repetido chegue em paralelo.
+    operations = [
+        UpdateOne(
+            {"email": email},
+            {"$setOnInsert": {"name": pending[email], "email": email, "password": hashed_password}},
+            upsert=True,
+        )
+        for email, hashed_password in zip(passwords, hashes)
+    ]
+    emails = list(passwords)
+    try:
+        result = await user_collection.bulk_write(operations, ordered=False)
+        created_indexes = set(result.upserted_ids)
+    except BulkWriteError as e:
+        # Corridas no índice único (E11000) significam que outro processo criou o usuário antes.
+        if any(error["code"] != DUPLICATE_KEY_ERROR for error in e.details["writeErrors"]):
+            raise
+        created_indexes = {upserted["index"] for upserted in e.details["upserted"]}
+
+    return [
+        {"name": pending[emails[index]], "email": emails[index], "password": passwords[emails[index]]}
+        for index in sorted(created_indexes)
+    ]
+
+
+async def reset_passwords(buyers: Iterable[Tuple[str, str]]) -> List[dict]:
+    """
+    Gera uma nova senha para usuários que já existem e cujo e-mail de acesso nunca foi
+    confirmado (a senha original só existiu em memória). Retorna nome, e-mail e a nova senha.
+    """
+    pending = {}
+    for name, email in buyers:
+        pending.setdefault(email, name)
+    if not pending:
+        return []
+
+    passwords = {email: utils.generate_random_password() for email in pending}
+    hashes = await asyncio.gather(*(utils.hash_password_async(password) for password in passwords.values()))
+    await user_collection.bulk_write(
+        [
+            UpdateOne({"email": email}, {"$set": {"password": hashed_password}})
+            for email, hashed_password in zip(passwords, hashes)
+        ],
+        ordered=False,
+    )
+    for email in passwords:
+        login_guard.invalidate(email)
+        logging.info(f"Nova senha gerada para {email}: o e-mail de acesso anterior não foi confirmado.")
+
+    return [{"name": name, "email": email, "password": passwords[email]} for email, name in pending.items()]
+
+
+async def rehash_password(email: str, password: str, old_hash: str) -> None:
+    """
+    Refaz o hash da senha com o custo atual do bcrypt (chamado após um login válido).
+    É oportunista: se o pool de hashing estiver saturado, fica para o próximo login.
+    """
+    if email in _rehashing:
+        return
+    _rehashing.add(email)
+    metrics.background_tasks_in_progress.inc("rehash")
+    try:
+        with metrics.background_task_duration.time("rehash"):
+            new_hash = await utils.hash_password_async(password, wait=False)
+            # Só troca se o hash ainda for o que foi verificado (outro processo pode ter trocado antes).
+            result = await user_collection.update_one(
+                {"email": email, "password": old_hash}, {"$set": {"password": new_hash}}
+            )
+        if result.modified_count:
+            login_guard.remember(email, password, new_hash)
+            logging.info(f"Hash da senha de {email} atualizado para o custo {utils.BCRYPT_ROUNDS}.")
+    except utils.HashingBusyError:
+        pass
+    except Exception as e:
+        logging.error(f"Falha ao refazer o hash da senha de {email}: {e}")
+    finally:
+        metrics.background_tasks_in_progress.dec("rehash")
+        _rehashing.discard(email)
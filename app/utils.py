@@ -1,6 +1,65 @@
+import os
+import time
+import asyncio
+import logging
 import secrets
 import string
+from contextlib import nullcontext
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Optional
+
 import bcrypt
+from dotenv import load_dotenv
+from pymongo.errors import DuplicateKeyError
+
+from .database import get_settings_collection
+from . import metrics
+
+load_dotenv()
+
+# --- Configuração do pool de hashing ---
+# O bcrypt é CPU-bound e bloqueia o event loop; por isso as versões assíncronas
+# abaixo rodam em um pool separado, dimensionado pelos núcleos da máquina.
+BCRYPT_EXECUTOR = os.getenv("BCRYPT_EXECUTOR", "process").lower()  # "process" ou "thread"
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", os.cpu_count() or 1))
+# Máximo de operações bcrypt em andamento (rodando + aguardando no pool).
+BCRYPT_MAX_IN_FLIGHT = int(os.getenv("BCRYPT_MAX_IN_FLIGHT", BCRYPT_WORKERS * 4))
+# Na API, quantas dessas vagas os hashes de senha (criação de usuários, rehash) podem ocupar
+# ao mesmo tempo; o restante fica reservado para as verificações de login, que não esperam na
+# fila. Só vale depois de reserve_login_slots(): scripts como o CLI de importação usam o pool todo.
+BCRYPT_BACKGROUND_MAX_IN_FLIGHT = int(os.getenv("BCRYPT_BACKGROUND_MAX_IN_FLIGHT", max(1, BCRYPT_WORKERS // 2)))
+# Valor (em segundos) devolvido no cabeçalho Retry-After quando a fila está cheia.
+BCRYPT_RETRY_AFTER = int(os.getenv("BCRYPT_RETRY_AFTER", 1))
+
+# --- Custo (work factor) do bcrypt ---
+# Hashes com custo menor que BCRYPT_ROUNDS são refeitos no próximo login bem-sucedido.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+# Com BCRYPT_CALIBRATE=true, o custo vem da calibração salva no banco: o maior entre
+# BCRYPT_MIN_ROUNDS e BCRYPT_MAX_ROUNDS cujo hash leva até BCRYPT_TARGET_MS. Ela é feita uma
+# única vez (pelo primeiro processo a subir, ou por python -m app.calibrate --save) e vale
+# para todos os workers.
+BCRYPT_CALIBRATE = os.getenv("BCRYPT_CALIBRATE", "false").lower() in ("1", "true", "yes")
+BCRYPT_TARGET_MS = float(os.getenv("BCRYPT_TARGET_MS", 250))
+BCRYPT_MIN_ROUNDS = int(os.getenv("BCRYPT_MIN_ROUNDS", 10))
+BCRYPT_MAX_ROUNDS = int(os.getenv("BCRYPT_MAX_ROUNDS", 16))
+
+# _id do documento da calibração na coleção de configurações.
+CALIBRATION_SETTING = "bcrypt_rounds"
+
+_executor: Optional[Executor] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+_background_semaphore: Optional[asyncio.Semaphore] = None
+_background_limit: Optional[int] = None
+
+
+class HashingBusyError(Exception):
+    """Levantada quando a fila de hashing está saturada e a chamada não pode esperar."""
+
+    def __init__(self, retry_after: int = BCRYPT_RETRY_AFTER):
+        super().__init__("Fila de hashing saturada.")
+        self.retry_after = retry_after
+
 
 def generate_random_password(length: int = 8) -> str:
     """Gera uma senha aleatória segura com letras e dígitos."""
@@ -8,10 +67,10 @@ def generate_random_password(length: int = 8) -> str:
     password = ''.join(secrets.choice(alphabet) for i in range(length))
     return password
 
-def hash_password(password: str) -> str:
-    """Criptografa a senha usando bcrypt."""
+def hash_password(password: str, rounds: Optional[int] = None) -> str:
+    """Criptografa a senha usando bcrypt (custo BCRYPT_ROUNDS, salvo se `rounds` for informado)."""
     password_bytes = password.encode('utf-8')
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds or BCRYPT_ROUNDS)
     hashed_password = bcrypt.hashpw(password_bytes, salt)
     return hashed_password.decode('utf-8')
 
@@ -19,4 +78,152 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifica se a senha enviada corresponde ao hash armazenado."""
     plain_password_bytes = plain_password.encode('utf-8')
     hashed_password_bytes = hashed_password.encode('utf-8')
-    return bcrypt.checkpw(plain_password_bytes, hashed_password_bytes)
\ No newline at end of file
+    return bcrypt.checkpw(plain_password_bytes, hashed_password_bytes)
+
+def get_rounds(hashed_password: str) -> Optional[int]:
+    """Extrai o custo de um hash bcrypt ("$2b$12$..." -> 12)."""
+    try:
+        return int(hashed_password.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+def needs_rehash(hashed_password: str) -> bool:
+    """
+    True se o hash foi gerado com um custo menor que o configurado.
+    Hashes mais caros ficam como estão: baixar o custo não justifica regravar a senha,
+    e workers com configurações diferentes não ficam trocando o hash um do outro.
+    """
+    rounds = get_rounds(hashed_password)
+    return rounds is not None and rounds < BCRYPT_ROUNDS
+
+def calibrate_rounds(target_ms: float = BCRYPT_TARGET_MS,
+                     min_rounds: int = BCRYPT_MIN_ROUNDS,
+                     max_rounds: int = BCRYPT_MAX_ROUNDS) -> int:
+    """
+    Mede o tempo de hash nesta máquina e retorna o maior custo dentro de `target_ms`.
+    Cada custo a mais dobra o tempo, então a medição para no primeiro que passa do limite.
+    """
+    chosen = min_rounds
+    for rounds in range(min_rounds, max_rounds + 1):
+        started = time.perf_counter()
+        bcrypt.hashpw(b"calibration", bcrypt.gensalt(rounds))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if elapsed_ms > target_ms:
+            break
+        chosen = rounds
+    return chosen
+
+
+# --- Versões assíncronas (fora do event loop) ---
+
+def _get_executor() -> Executor:
+    """Cria o pool de hashing sob demanda, uma vez por processo."""
+    global _executor
+    if _executor is None:
+        if BCRYPT_EXECUTOR == "thread":
+            _executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+        else:
+            _executor = ProcessPoolExecutor(max_workers=BCRYPT_WORKERS)
+    return _executor
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(BCRYPT_MAX_IN_FLIGHT)
+    return _semaphore
+
+def reserve_login_slots(background_limit: int = BCRYPT_BACKGROUND_MAX_IN_FLIGHT) -> None:
+    """Limita os hashes a `background_limit` vagas do pool (chamado na inicialização da API)."""
+    global _background_limit, _background_semaphore
+    _background_limit = background_limit
+    _background_semaphore = None
+
+def _get_background_semaphore() -> Optional[asyncio.Semaphore]:
+    global _background_semaphore
+    if _background_limit is None:
+        return None
+    if _background_semaphore is None:
+        _background_semaphore = asyncio.Semaphore(_background_limit)
+    return _background_semaphore
+
+async def _run_bcrypt(func, *args, wait: bool):
+    """
+    Executa uma função bcrypt no pool respeitando o limite de operações em andamento.
+    Com wait=False, levanta HashingBusyError em vez de entrar na fila quando ela está cheia.
+    Na API, hashes passam antes pelo sublimite de reserve_login_slots(): um lote grande da
+    outbox espera a sua vez em vez de ocupar o pool inteiro e derrubar os logins com 503.
+    """
+    semaphore = _get_semaphore()
+    background = _get_background_semaphore() if func is hash_password else None
+    if not wait and (semaphore.locked() or (background is not None and background.locked())):
+        metrics.bcrypt_rejected_total.inc()
+        raise HashingBusyError()
+
+    metrics.bcrypt_in_flight.inc()
+    try:
+        with metrics.bcrypt_duration.time(_OPERATIONS[func]):
+            async with background or nullcontext():
+                async with semaphore:
+                    loop = asyncio.get_running_loop()
+                    return await loop.run_in_executor(_get_executor(), func, *args)
+    finally:
+        metrics.bcrypt_in_flight.dec()
+
+_OPERATIONS = {hash_password: "hash", verify_password: "verify"}
+
+async def hash_password_async(password: str, wait: bool = True) -> str:
+    """Versão assíncrona de hash_password, executada no pool de hashing."""
+    # O custo vai explícito: os processos do pool não enxergam a calibração feita aqui.
+    return await _run_bcrypt(hash_password, password, BCRYPT_ROUNDS, wait=wait)
+
+async def verify_password_async(plain_password: str, hashed_password: str, wait: bool = False) -> bool:
+    """
+    Versão assíncrona de verify_password, executada no pool de hashing.
+    Por padrão não espera na fila: requisições de login recebem HashingBusyError
+    (e um 503 rápido) quando o pool está saturado.
+    """
+    return await _run_bcrypt(verify_password, plain_password, hashed_password, wait=wait)
+
+async def store_calibrated_rounds(rounds: int, replace: bool = True) -> int:
+    """
+    Grava o custo calibrado para todos os workers e retorna o valor em vigor.
+    Com replace=False, só grava se ainda não houver calibração (o primeiro a gravar vence).
+    """
+    settings = get_settings_collection()
+    document = {"rounds": rounds, "calibrated_at": datetime.now(timezone.utc)}
+    try:
+        await settings.update_one(
+            {"_id": CALIBRATION_SETTING}, {"$set" if replace else "$setOnInsert": document}, upsert=True
+        )
+    except DuplicateKeyError:
+        # Outro worker gravou a calibração ao mesmo tempo.
+        pass
+    stored = await settings.find_one({"_id": CALIBRATION_SETTING})
+    return stored["rounds"]
+
+async def configure_rounds() -> None:
+    """
+    Adota o custo calibrado do bcrypt, se BCRYPT_CALIBRATE estiver ativo.
+    Só mede nesta máquina se o banco ainda não tiver uma calibração; assim todos os
+    workers do deploy usam o mesmo custo.
+    """
+    global BCRYPT_ROUNDS
+    if not BCRYPT_CALIBRATE:
+        return
+    stored = await get_settings_collection().find_one({"_id": CALIBRATION_SETTING})
+    if stored is not None:
+        BCRYPT_ROUNDS = stored["rounds"]
+        return
+    loop = asyncio.get_running_loop()
+    measured = await loop.run_in_executor(_get_executor(), calibrate_rounds)
+    BCRYPT_ROUNDS = await store_calibrated_rounds(measured, replace=False)
+    logging.info(f"Custo do bcrypt calibrado para {BCRYPT_ROUNDS} (limite de {BCRYPT_TARGET_MS:.0f} ms por hash).")
+
+def shutdown_executor() -> None:
+    """Encerra o pool de hashing (chamado no desligamento da aplicação)."""
+    global _executor, _semaphore, _background_semaphore
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+    _semaphore = None
+    _background_semaphore = None
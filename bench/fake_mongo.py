@@ -0,0 +1,387 @@
+"""
+Substituto em memória do MongoDB para os benchmarks.
+
+Implementa só o subconjunto da API do Motor que a aplicação usa (find/find_one com
+projeção, insert, update com upsert, bulk_write, create_indexes e agregações simples), com índice único
+de verdade e uma latência opcional por operação para simular a ida e volta da rede.
+"""
+
+import asyncio
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+_MISSING = object()
+DUPLICATE_KEY_ERROR = 11000
+
+
+def _get(doc: dict, key: str):
+    return doc.get(key, _MISSING)
+
+
+def _compare(op: str, value, arg) -> bool:
+    if value is _MISSING or value is None:
+        return False
+    if op == "$lt":
+        return value < arg
+    if op == "$lte":
+        return value <= arg
+    if op == "$gt":
+        return value > arg
+    return value >= arg
+
+
+def _match(doc: dict, flt: dict) -> bool:
+    for key, cond in flt.items():
+        if key == "$or":
+            if not any(_match(doc, sub) for sub in cond):
+                return False
+            continue
+        if key == "$and":
+            if not all(_match(doc, sub) for sub in cond):
+                return False
+            continue
+
+        value = _get(doc, key)
+        if isinstance(cond, dict) and cond and all(op.startswith("$") for op in cond):
+            for op, arg in cond.items():
+                if op == "$in":
+                    ok = value in arg
+                elif op == "$nin":
+                    ok = value not in arg
+                elif op == "$ne":
+                    ok = value != arg
+                elif op == "$exists":
+                    ok = (value is not _MISSING) == bool(arg)
+                elif op in ("$lt", "$lte", "$gt", "$gte"):
+                    ok = _compare(op, value, arg)
+                else:
+                    raise NotImplementedError(f"Operador {op} não suportado pelo FakeCollection.")
+                if not ok:
+                    return False
+        elif (None if value is _MISSING else value) != cond:
+            return False
+    return True
+
+
+def _project(doc: dict, projection: Optional[dict]) -> dict:
+    if not projection:
+        return dict(doc)
+    included = [key for key, flag in projection.items() if flag and key != "_id"]
+    if included:
+        result = {key: doc[key] for key in included if key in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            result["_id"] = doc["_id"]
+        return result
+    excluded = {key for key, flag in projection.items() if not flag}
+    return {key: value for key, value in doc.items() if key not in excluded}
+
+
+def _apply_update(doc: dict, update: dict, inserting: bool) -> bool:
+    """Aplica $set/$unset/$inc/$setOnInsert. Retorna True se o documento mudou."""
+    before = dict(doc)
+    for op, fields in update.items():
+        if op == "$set" or (op == "$setOnInsert" and inserting):
+            doc.update(fields)
+        elif op == "$unset":
+            for key in fields:
+                doc.pop(key, None)
+        elif op == "$inc":
+            for key, amount in fields.items():
+                doc[key] = doc.get(key, 0) + amount
+        elif op != "$setOnInsert":
+            raise NotImplementedError(f"Operador de atualização {op} não suportado pelo FakeCollection.")
+    return doc != before
+
+
+class FakeCursor:
+    def __init__(self, collection: "FakeCollection", flt: dict, projection: Optional[dict]):
+        self._collection = collection
+        self._filter = flt
+        self._projection = projection
+        self._sort = None
+        self._limit = 0
+
+    def sort(self, key: str, direction: int = 1) -> "FakeCursor":
+        self._sort = (key, direction)
+        return self
+
+    def limit(self, count: int) -> "FakeCursor":
+        self._limit = count
+        return self
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        await self._collection._io()
+        docs = self._collection._find(self._filter)
+        if self._sort:
+            key, direction = self._sort
+            docs.sort(key=lambda doc: doc.get(key), reverse=direction < 0)
+        limit = min(filter(None, (self._limit, length)), default=0)
+        if limit:
+            docs = docs[:limit]
+        return [_project(doc, self._projection) for doc in docs]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in await self.to_list(None):
+            yield doc
+
+
+class FakeAggregation:
+    """Pipeline com os estágios $group ($sum), $match, $sort e $limit."""
+
+    def __init__(self, collection: "FakeCollection", pipeline: List[dict]):
+        self._collection = collection
+        self._pipeline = pipeline
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        await self._collection._io()
+        docs = [dict(doc) for doc in self._collection._docs.values()]
+        for stage in self._pipeline:
+            (op, arg), = stage.items()
+            if op == "$group":
+                groups: Dict[Any, dict] = {}
+                for doc in docs:
+                    key = doc.get(arg["_id"][1:])
+                    group = groups.setdefault(key, {"_id": key, **{name: 0 for name in arg if name != "_id"}})
+                    for name, acc in arg.items():
+                        if name != "_id":
+                            (acc_op, value), = acc.items()
+                            if acc_op != "$sum":
+                                raise NotImplementedError(f"Acumulador {acc_op} não suportado pelo FakeCollection.")
+                            group[name] += value
+                docs = list(groups.values())
+            elif op == "$match":
+                docs = [doc for doc in docs if _match(doc, arg)]
+            elif op == "$sort":
+                for key, direction in reversed(list(arg.items())):
+                    docs.sort(key=lambda doc: doc.get(key), reverse=direction < 0)
+            elif op == "$limit":
+                docs = docs[:arg]
+            else:
+                raise NotImplementedError(f"Estágio {op} não suportado pelo FakeCollection.")
+        return docs[:length] if length else docs
+
+
+class FakeCollection:
+    """Coleção em memória com índices de igualdade (e unicidade) por campo."""
+
+    def __init__(self, name: str, latency: float = 0.0):
+        self.name = name
+        self.latency = latency
+        self._docs: Dict[Any, dict] = {}
+        # campo -> valor -> conjunto de _ids
+        self._indexes: Dict[str, Dict[Any, set]] = {}
+        self._unique = set()
+        self._index_names: Dict[str, dict] = {"_id_": {"key": [("_id", 1)]}}
+
+    async def _io(self) -> None:
+        await asyncio.sleep(self.latency)
+
+    # --- índices ---
+
+    async def create_indexes(self, models) -> List[str]:
+        await self._io()
+        names = []
+        for model in models:
+            spec = model.document
+            keys = list(spec["key"])
+            if len(keys) == 1:
+                field = keys[0]
+                if field not in self._indexes:
+                    self._indexes[field] = {}
+                    for doc in self._docs.values():
+                        self._index_add(doc)
+                if spec.get("unique"):
+                    self._unique.add(field)
+            self._index_names[spec["name"]] = {"key": list(spec["key"].items()), "unique": bool(spec.get("unique"))}
+            names.append(spec["name"])
+        return names
+
+    async def index_information(self) -> Dict[str, dict]:
+        await self._io()
+        return dict(self._index_names)
+
+    def _index_add(self, doc: dict) -> None:
+        for field, index in self._indexes.items():
+            if field in doc:
+                index.setdefault(doc[field], set()).add(doc["_id"])
+
+    def _index_remove(self, doc: dict) -> None:
+        for field, index in self._indexes.items():
+            if field in doc:
+                ids = index.get(doc[field])
+                if ids:
+                    ids.discard(doc["_id"])
+                    if not ids:
+                        del index[doc[field]]
+
+    def _check_unique(self, doc: dict, current_id=None) -> None:
+        for field in self._unique:
+            if field in doc:
+                ids = self._indexes[field].get(doc[field], set()) - {current_id}
+                if ids:
+                    raise DuplicateKeyError(
+                        f"E11000 duplicate key error collection: {self.name} dup key: {{ {field}: {doc[field]!r} }}",
+                        DUPLICATE_KEY_ERROR,
+                    )
+
+    def _candidates(self, flt: dict):
+        """Usa um índice de igualdade quando o filtro permite; senão percorre a coleção."""
+        if "_id" in flt and not isinstance(flt["_id"], dict):
+            doc = self._docs.get(flt["_id"])
+            return [doc] if doc else []
+        for field, index in self._indexes.items():
+            cond = flt.get(field, _MISSING)
+            if cond is _MISSING:
+                continue
+            if isinstance(cond, dict) and set(cond) == {"$in"}:
+                ids = set().union(*(index.get(value, set()) for value in cond["$in"]))
+            elif not isinstance(cond, dict):
+                ids = index.get(cond, set())
+            else:
+                continue
+            return [self._docs[_id] for _id in ids]
+        if "_id" in flt and set(flt["_id"]) == {"$in"}:
+            return [self._docs[_id] for _id in flt["_id"]["$in"] if _id in self._docs]
+        return list(self._docs.values())
+
+    def _find(self, flt: dict) -> List[dict]:
+        return [doc for doc in self._candidates(flt) if _match(doc, flt)]
+
+    # --- leitura ---
+
+    def find(self, flt: Optional[dict] = None, projection: Optional[dict] = None) -> FakeCursor:
+        return FakeCursor(self, flt or {}, projection)
+
+    async def find_one(self, flt: Optional[dict] = None, projection: Optional[dict] = None) -> Optional[dict]:
+        await self._io()
+        docs = self._find(flt or {})
+        return _project(docs[0], projection) if docs else None
+
+    def aggregate(self, pipeline: List[dict]) -> FakeAggregation:
+        return FakeAggregation(self, pipeline)
+
+    async def count_documents(self, flt: dict) -> int:
+        await self._io()
+        return len(self._find(flt))
+
+    # --- escrita ---
+
+    def _insert(self, doc: dict) -> Any:
+        doc.setdefault("_id", ObjectId())
+        self._check_unique(doc)
+        stored = dict(doc)
+        self._docs[stored["_id"]] = stored
+        self._index_add(stored)
+        return stored["_id"]
+
+    def _update(self, flt: dict, update: dict, upsert: bool, many: bool) -> SimpleNamespace:
+        docs = self._find(flt)
+        if not many:
+            docs = docs[:1]
+        if not docs and upsert:
+            doc = {key: value for key, value in flt.items() if not key.startswith("$") and not isinstance(value, dict)}
+            _apply_update(doc, update, inserting=True)
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=self._insert(doc))
+
+        modified = 0
+        for doc in docs:
+            updated = dict(doc)
+            if _apply_update(updated, update, inserting=False):
+                self._check_unique(updated, doc["_id"])
+                self._index_remove(doc)
+                doc.clear()
+                doc.update(updated)
+                self._index_add(doc)
+                modified += 1
+        return SimpleNamespace(matched_count=len(docs), modified_count=modified, upserted_id=None)
+
+    async def insert_one(self, doc: dict) -> SimpleNamespace:
+        await self._io()
+        return SimpleNamespace(inserted_id=self._insert(doc), acknowledged=True)
+
+    async def insert_many(self, docs: List[dict], ordered: bool = True) -> SimpleNamespace:
+        await self._io()
+        return await self._bulk([InsertOne(doc) for doc in docs], ordered, insert_many=True)
+
+    async def update_one(self, flt: dict, update: dict, upsert: bool = False) -> SimpleNamespace:
+        await self._io()
+        return self._update(flt, update, upsert, many=False)
+
+    async def update_many(self, flt: dict, update: dict, upsert: bool = False) -> SimpleNamespace:
+        await self._io()
+        return self._update(flt, update, upsert, many=True)
+
+    async def bulk_write(self, operations, ordered: bool = True) -> SimpleNamespace:
+        await self._io()
+        return await self._bulk(operations, ordered)
+
+    async def _bulk(self, operations, ordered: bool, insert_many: bool = False) -> SimpleNamespace:
+        inserted_ids, upserted, errors = [], [], []
+        matched = modified = 0
+        for index, operation in enumerate(operations):
+            try:
+                if isinstance(operation, InsertOne):
+                    inserted_ids.append(self._insert(operation._doc))
+                elif isinstance(operation, UpdateOne):
+                    result = self._update(operation._filter, operation._doc, operation._upsert, many=False)
+                    matched += result.matched_count
+                    modified += result.modified_count
+                    if result.upserted_id is not None:
+                        upserted.append({"index": index, "_id": result.upserted_id})
+                else:
+                    raise NotImplementedError(f"Operação {type(operation).__name__} não suportada pelo FakeCollection.")
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": DUPLICATE_KEY_ERROR, "errmsg": str(e)})
+                if ordered:
+                    break
+
+        if errors:
+            raise BulkWriteError({
+                "writeErrors": errors, "writeConcernErrors": [], "nInserted": len(inserted_ids),
+                "nUpserted": len(upserted), "nMatched": matched, "nModified": modified,
+                "nRemoved": 0, "upserted": upserted,
+            })
+        if insert_many:
+            return SimpleNamespace(inserted_ids=inserted_ids, acknowledged=True)
+        return SimpleNamespace(
+            inserted_count=len(inserted_ids), matched_count=matched, modified_count=modified,
+            upserted_count=len(upserted), upserted_ids={item["index"]: item["_id"] for item in upserted},
+        )
+
+
+class FakeDatabase:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._collections: Dict[str, FakeCollection] = {}
+
+    def __getattr__(self, name: str) -> FakeCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(name, self.latency)
+        return self._collections[name]
+
+
+def install(latency: float = 0.0) -> FakeDatabase:
+    """
+    Troca o banco de app.database por um FakeDatabase.
+    Precisa rodar antes de importar app.main (os módulos guardam as coleções na importação).
+    """
+    from app import database
+
+    fake = FakeDatabase(latency)
+    database.database = fake
+    database.user_collection = fake.users
+    database.outbox_collection = fake.webhook_outbox
+    database.settings_collection = fake.app_settings
+    return fake
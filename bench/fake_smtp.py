@@ -0,0 +1,100 @@
+"""
+Servidor SMTP local que aceita e descarta mensagens, para os benchmarks.
+
+Fala o mínimo do protocolo que o aiosmtplib usa (EHLO, AUTH PLAIN/LOGIN, MAIL, RCPT,
+DATA, RSET, NOOP, QUIT), sem TLS, e conta conexões, logins e mensagens recebidas.
+"""
+
+import asyncio
+from typing import Optional
+
+
+class FakeSMTPServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        self.host = host
+        self.port = port
+        # Atraso aplicado a cada resposta, para simular um provedor remoto.
+        self.latency = latency
+        self.connections = 0
+        self.logins = 0
+        self.messages = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> "FakeSMTPServer":
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _reply(self, writer: asyncio.StreamWriter, line: str) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        writer.write(line.encode("ascii") + b"\r\n")
+        await writer.drain()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            await self._reply(writer, "220 fake-smtp ESMTP ready")
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode("ascii", "replace").strip()
+                verb = command.split(" ", 1)[0].upper()
+
+                if verb in ("EHLO", "HELO"):
+                    writer.write(b"250-fake-smtp\r\n250-AUTH PLAIN LOGIN\r\n250-8BITMIME\r\n")
+                    await self._reply(writer, "250 SIZE 10485760")
+                elif verb == "AUTH":
+                    parts = command.split()
+                    if parts[1].upper() == "LOGIN":
+                        await self._reply(writer, "334 VXNlcm5hbWU6")
+                        await reader.readline()
+                        await self._reply(writer, "334 UGFzc3dvcmQ6")
+                        await reader.readline()
+                    elif len(parts) == 2:
+                        await self._reply(writer, "334 ")
+                        await reader.readline()
+                    self.logins += 1
+                    await self._reply(writer, "235 2.7.0 Authentication successful")
+                elif verb == "DATA":
+                    await self._reply(writer, "354 End data with <CR><LF>.<CR><LF>")
+                    while True:
+                        data_line = await reader.readline()
+                        if not data_line or data_line == b".\r\n":
+                            break
+                    self.messages += 1
+                    await self._reply(writer, "250 2.0.0 OK")
+                elif verb == "QUIT":
+                    await self._reply(writer, "221 2.0.0 Bye")
+                    break
+                elif verb in ("MAIL", "RCPT", "RSET", "NOOP"):
+                    await self._reply(writer, "250 2.0.0 OK")
+                else:
+                    await self._reply(writer, "502 5.5.2 Command not implemented")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def _serve(host: str, port: int) -> None:
+    server = await FakeSMTPServer(host, port).start()
+    print(f"SMTP falso ouvindo em {server.host}:{server.port}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Servidor SMTP falso para testes de carga.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2525)
+    args = parser.parse_args()
+    asyncio.run(_serve(args.host, args.port))
@@ -0,0 +1,336 @@
+"""
+Teste de carga reproduzível da API, sem MongoDB nem SMTP de verdade.
+
+Sobe a aplicação FastAPI no próprio processo (com lifespan, worker da outbox e fila de
+e-mails), trocando o banco por bench.fake_mongo e o provedor de e-mail por bench.fake_smtp.
+Dispara uma mistura de requisições com concorrência fixa e salva um JSON com vazão,
+latências p50/p95/p99 por rota e o tempo em que o event loop ficou bloqueado.
+
+Uso:
+    python -m bench.run --duration 20 --concurrency 50 --mix webhook=3,login=1
+    python -m bench.run --processes 4 --output bench/results/4-workers.json
+    python -m bench.run --compare bench/results/baseline.json --max-regression 10
+
+--processes N roda N cópias independentes da aplicação (cada uma com seu event loop,
+pool de bcrypt e banco em memória), como N workers do gunicorn na mesma máquina.
+O gerador de carga roda no mesmo event loop da aplicação; por isso o atraso medido
+inclui o custo do cliente, que é pequeno e igual entre versões.
+"""
+
+import os
+import sys
+import math
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from typing import Dict, List
+
+OPERATIONS = ("webhook", "login", "verify")
+BENCH_PASSWORD = "bench-password"
+LOOP_MONITOR_INTERVAL = 0.005 # segundos
+
+
+def _parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"operação desconhecida: {name} (use {', '.join(OPERATIONS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def _parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m bench.run", description="Teste de carga da API.")
+    parser.add_argument("--duration", type=float, default=15, help="segundos de medição")
+    parser.add_argument("--warmup", type=float, default=2, help="segundos de aquecimento (não medidos)")
+    parser.add_argument("--concurrency", type=int, default=32, help="requisições simultâneas por processo")
+    parser.add_argument("--mix", type=_parse_mix, default="webhook=1,login=1",
+                        help="pesos das operações, ex.: webhook=3,login=1,verify=1")
+    parser.add_argument("--processes", type=int, default=1, help="cópias da aplicação (workers)")
+    parser.add_argument("--users", type=int, default=200, help="usuários pré-cadastrados para o login")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12, help="custo do bcrypt (BCRYPT_ROUNDS)")
+    parser.add_argument("--no-login-cache", action="store_true", help="desliga o cache de verificação do login")
+    parser.add_argument("--mongo-latency-ms", type=float, default=0.5, help="latência simulada por operação no banco")
+    parser.add_argument("--smtp-latency-ms", type=float, default=0.0, help="latência simulada por resposta SMTP")
+    parser.add_argument("--seed", type=int, default=1234, help="semente da mistura de requisições")
+    parser.add_argument("--output", help="arquivo JSON do resultado (padrão: bench/results/<data>.json)")
+    parser.add_argument("--compare", help="JSON de uma execução anterior para comparar")
+    parser.add_argument("--max-regression", type=float,
+                        help="com --compare, sai com erro se vazão cair ou p99 subir mais que este percentual")
+    return parser.parse_args(argv)
+
+
+# --- Execução em um processo ---
+
+def _configure_environment(args: dict, smtp_port: int) -> None:
+    """Variáveis lidas pela aplicação na importação; sobrescrevem as do .env."""
+    os.environ.update({
+        "MONGO_URL": "mongodb://127.0.0.1:1/",
+        "AUTH_TOKEN_SECRET": "bench-secret",
+        "SMTP_SERVER": "127.0.0.1",
+        "SMTP_PORT": str(smtp_port),
+        "SMTP_USERNAME": "bench@example.com",
+        "SMTP_PASSWORD": "bench",
+        "SMTP_USE_TLS": "false",
+        "BCRYPT_ROUNDS": str(args["bcrypt_rounds"]),
+        "BCRYPT_CALIBRATE": "false",
+        "OUTBOX_SHUTDOWN_TIMEOUT": "5",
+        "MAIL_SHUTDOWN_TIMEOUT": "5",
+    })
+    if args["no_login_cache"]:
+        os.environ["LOGIN_CACHE_TTL"] = "0"
+
+
+async def _monitor_loop(lags: List[float]) -> None:
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(LOOP_MONITOR_INTERVAL)
+        lags.append(max(0.0, time.perf_counter() - started - LOOP_MONITOR_INTERVAL))
+
+
+async def _bench_process(index: int, args: dict) -> dict:
+    import logging
+    import httpx
+    from .fake_smtp import FakeSMTPServer
+    from . import fake_mongo
+
+    smtp = await FakeSMTPServer(latency=args["smtp_latency_ms"] / 1000).start()
+    _configure_environment(args, smtp.port)
+
+    # A ordem importa: o banco falso entra antes de app.main guardar as coleções.
+    import app.database  # noqa: F401
+    fake_db = fake_mongo.install(latency=args["mongo_latency_ms"] / 1000)
+    from app import utils
+    from app.main import app
+
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    emails = [f"user{n}@example.com" for n in range(args["users"])]
+    password_hash = utils.hash_password(BENCH_PASSWORD)
+    await fake_db.users.insert_many(
+        [{"name": f"Usuário {n}", "email": email, "password": password_hash} for n, email in enumerate(emails)]
+    )
+
+    rng = random.Random(args["seed"] + index)
+    operations = list(args["mix"])
+    weights = [args["mix"][name] for name in operations]
+    sequence = iter(range(10 ** 12))
+    latencies: Dict[str, List[float]] = {name: [] for name in operations}
+    statuses: Dict[str, Dict[str, int]] = {name: {} for name in operations}
+    recording = False
+
+    async def request(client: httpx.AsyncClient, name: str, tokens: List[str]) -> int:
+        if name == "webhook":
+            payload = {"event_name": "invoice_paid", "cus_name": "Comprador",
+                       "cus_email": f"buyer{index}-{next(sequence)}@example.com"}
+            response = await client.post("/eduzz/webhook", json=payload)
+        elif name == "login":
+            response = await client.post("/auth/login", json={"email": rng.choice(emails), "password": BENCH_PASSWORD})
+        else:
+            response = await client.get("/auth/verify", headers={"Authorization": f"Bearer {rng.choice(tokens)}"})
+        return response.status_code
+
+    async def worker(client: httpx.AsyncClient, deadline: float, tokens: List[str]) -> None:
+        while time.perf_counter() < deadline:
+            name = rng.choices(operations, weights)[0]
+            started = time.perf_counter()
+            try:
+                status_code = str(await request(client, name, tokens))
+            except Exception as e:
+                status_code = type(e).__name__
+            if recording:
+                latencies[name].append(time.perf_counter() - started)
+                statuses[name][status_code] = statuses[name].get(status_code, 0) + 1
+
+    lags: List[float] = []
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            tokens = []
+            for email in emails[:20]:
+                response = await client.post("/auth/login", json={"email": email, "password": BENCH_PASSWORD})
+                response.raise_for_status()
+                tokens.append(response.json()["access_token"])
+
+            deadline = time.perf_counter() + args["warmup"]
+            await asyncio.gather(*(worker(client, deadline, tokens) for _ in range(args["concurrency"])))
+
+            recording = True
+            monitor = asyncio.create_task(_monitor_loop(lags))
+            started = time.perf_counter()
+            deadline = started + args["duration"]
+            await asyncio.gather(*(worker(client, deadline, tokens) for _ in range(args["concurrency"])))
+            elapsed = time.perf_counter() - started
+            monitor.cancel()
+
+        backlog = await fake_db.webhook_outbox.count_documents({"status": {"$in": ["pending", "processing"]}})
+        mails_before_shutdown = smtp.messages
+    await smtp.stop()
+
+    return {
+        "elapsed": elapsed,
+        "latencies": latencies,
+        "statuses": statuses,
+        "loop_lags": lags,
+        "outbox_backlog": backlog,
+        "mails_delivered": mails_before_shutdown,
+        "smtp_connections": smtp.connections,
+    }
+
+
+def _run_process(index: int, args: dict) -> dict:
+    return asyncio.run(_bench_process(index, args))
+
+
+# --- Agregação e relatório ---
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank: o menor valor que cobre `fraction` das amostras.
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def _latency_summary(values: List[float], elapsed: float) -> dict:
+    values = sorted(values)
+    to_ms = lambda seconds: round(seconds * 1000, 3)
+    return {
+        "requests": len(values),
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": to_ms(_percentile(values, 0.50)),
+        "p95_ms": to_ms(_percentile(values, 0.95)),
+        "p99_ms": to_ms(_percentile(values, 0.99)),
+        "max_ms": to_ms(values[-1]) if values else 0.0,
+        "mean_ms": to_ms(sum(values) / len(values)) if values else 0.0,
+    }
+
+
+def _aggregate(args: argparse.Namespace, runs: List[dict]) -> dict:
+    elapsed = max(run["elapsed"] for run in runs)
+    operations = {}
+    for name in args.mix:
+        values = [value for run in runs for value in run["latencies"][name]]
+        statuses: Dict[str, int] = {}
+        for run in runs:
+            for status_code, count in run["statuses"][name].items():
+                statuses[status_code] = statuses.get(status_code, 0) + count
+        summary = _latency_summary(values, elapsed)
+        summary["statuses"] = statuses
+        summary["errors"] = sum(count for status_code, count in statuses.items() if not status_code.startswith("2"))
+        operations[name] = summary
+
+    all_values = [value for run in runs for values in run["latencies"].values() for value in values]
+    lags = sorted(lag for run in runs for lag in run["loop_lags"])
+    blocked = [sum(run["loop_lags"]) for run in runs]
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "summary": _latency_summary(all_values, elapsed),
+        "operations": operations,
+        "event_loop": {
+            # Soma dos atrasos do loop em relação ao agendado: tempo em que ele ficou ocupado/bloqueado.
+            "blocked_seconds": round(sum(blocked), 3),
+            "blocked_ratio": round(sum(blocked) / (elapsed * len(runs)), 4) if elapsed else 0.0,
+            "p99_lag_ms": round(_percentile(lags, 0.99) * 1000, 3),
+            "max_lag_ms": round(lags[-1] * 1000, 3) if lags else 0.0,
+        },
+        "background": {
+            "outbox_backlog": sum(run["outbox_backlog"] for run in runs),
+            "mails_delivered": sum(run["mails_delivered"] for run in runs),
+            "smtp_connections": sum(run["smtp_connections"] for run in runs),
+        },
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def _compare(result: dict, baseline: dict, max_regression: float = None) -> bool:
+    """Imprime a variação em relação à execução anterior; False se houve regressão acima do limite."""
+    ok = True
+    print(f"\nComparação com {baseline['meta'].get('git_commit') or baseline['meta']['timestamp']}:")
+    for name, current in result["operations"].items():
+        previous = baseline["operations"].get(name)
+        if not previous:
+            continue
+        changes = {}
+        for metric in ("throughput_rps", "p99_ms"):
+            before, after = previous[metric], current[metric]
+            changes[metric] = ((after - before) / before * 100) if before else 0.0
+        print(f"  {name:8} vazão {previous['throughput_rps']:>9.1f} -> {current['throughput_rps']:>9.1f} rps "
+              f"({changes['throughput_rps']:+.1f}%)   p99 {previous['p99_ms']:>8.1f} -> {current['p99_ms']:>8.1f} ms "
+              f"({changes['p99_ms']:+.1f}%)")
+        if max_regression is not None and (
+            changes["throughput_rps"] < -max_regression or changes["p99_ms"] > max_regression
+        ):
+            ok = False
+    return ok
+
+
+def _print_report(result: dict) -> None:
+    print(f"{'operação':10} {'req':>8} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'erros':>7}")
+    for name, summary in list(result["operations"].items()) + [("total", result["summary"])]:
+        print(f"{name:10} {summary['requests']:>8} {summary['throughput_rps']:>9.1f} {summary['p50_ms']:>9.1f} "
+              f"{summary['p95_ms']:>9.1f} {summary['p99_ms']:>9.1f} {summary.get('errors', ''):>7}")
+    loop = result["event_loop"]
+    print(f"event loop: {loop['blocked_seconds']}s bloqueado ({loop['blocked_ratio']:.1%}), "
+          f"p99 {loop['p99_lag_ms']} ms, máx {loop['max_lag_ms']} ms")
+    background = result["background"]
+    print(f"outbox pendente: {background['outbox_backlog']}, e-mails entregues: {background['mails_delivered']} "
+          f"em {background['smtp_connections']} conexão(ões) SMTP")
+
+
+def main(argv=None) -> None:
+    args = _parse_args(argv)
+    process_args = vars(args)
+
+    if args.processes == 1:
+        runs = [_run_process(0, process_args)]
+    else:
+        # "spawn": cada processo importa a aplicação do zero, como um worker novo.
+        with ProcessPoolExecutor(max_workers=args.processes, mp_context=get_context("spawn")) as executor:
+            runs = list(executor.map(_run_process, range(args.processes), [process_args] * args.processes))
+
+    result = _aggregate(args, runs)
+    _print_report(result)
+
+    output = args.output or os.path.join(
+        "bench", "results", datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ") + ".json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as result_file:
+        json.dump(result, result_file, ensure_ascii=False, indent=2)
+    print(f"\nResultado salvo em {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        if not _compare(result, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
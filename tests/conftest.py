@@ -0,0 +1,34 @@
+"""
+Os testes rodam contra o MongoDB em memória de bench/fake_mongo (sem banco nem SMTP de verdade).
+As variáveis abaixo precisam existir antes de importar qualquer módulo de app/.
+"""
+
+import os
+
+os.environ.update({
+    "MONGO_URL": "mongodb://127.0.0.1:1/",
+    "AUTH_TOKEN_SECRET": "segredo-dos-testes",
+    "BCRYPT_EXECUTOR": "thread",
+    "BCRYPT_ROUNDS": "4",
+    "BCRYPT_CALIBRATE": "false",
+})
+
+import pytest
+
+from bench import fake_mongo
+
+fake_db = fake_mongo.install()
+
+from app import utils
+
+
+@pytest.fixture
+def db():
+    """Banco falso vazio a cada teste (os módulos de app/ guardam as mesmas coleções)."""
+    for collection in fake_db._collections.values():
+        collection._docs.clear()
+        for index in collection._indexes.values():
+            index.clear()
+    yield fake_db
+    # Semáforos do bcrypt ficam presos ao event loop de cada asyncio.run.
+    utils.shutdown_executor()
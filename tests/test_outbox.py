@@ -0,0 +1,134 @@
+import asyncio
+from datetime import timedelta
+
+from app import outbox, email_service, utils
+
+
+def _insert_event(db, **fields):
+    event = outbox._new_event("Comprador", "comprador@example.com", "invoice_paid", True, outbox._now())
+    event.update(fields)
+    return asyncio.run(db.webhook_outbox.insert_one(event)).inserted_id
+
+
+def _fake_delivery(monkeypatch, delivered: bool) -> list:
+    """Troca o envio por um que responde `delivered` e guarda os e-mails "enviados"."""
+    sent = []
+
+    async def send_access_email(name, email, password):
+        sent.append({"name": name, "email": email, "password": password})
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(delivered)
+        return future
+    monkeypatch.setattr(email_service, "send_access_email", send_access_email)
+    return sent
+
+
+def test_claim_batch_reclaims_expired_lease(db):
+    now = outbox._now()
+    expired = _insert_event(db, status="processing", claim_token="antigo",
+                            claimed_at=now - timedelta(seconds=outbox.OUTBOX_LEASE_SECONDS + 1))
+    _insert_event(db, status="processing", claim_token="ativo", claimed_at=now)
+
+    claimed = asyncio.run(outbox._claim_batch())
+
+    assert [event["_id"] for event in claimed] == [expired]
+    assert claimed[0]["claim_token"] not in ("antigo", "ativo")
+    assert claimed[0]["attempts"] == 1
+    assert asyncio.run(outbox._claim_batch()) == []
+
+
+def test_claim_batch_fails_event_whose_lease_keeps_expiring(db):
+    expired_at = outbox._now() - timedelta(seconds=outbox.OUTBOX_LEASE_SECONDS + 1)
+    event_id = _insert_event(db, status="processing", claim_token="antigo", claimed_at=expired_at,
+                             attempts=outbox.OUTBOX_MAX_ATTEMPTS - 1)
+
+    assert asyncio.run(outbox._claim_batch()) == []
+
+    event = asyncio.run(db.webhook_outbox.find_one({"_id": event_id}))
+    assert event["status"] == "failed"
+    assert event["attempts"] == outbox.OUTBOX_MAX_ATTEMPTS
+    assert "claim_token" not in event
+
+
+def test_mark_for_retry_gives_up_after_max_attempts(db):
+    last_try = _insert_event(db, status="processing", claim_token="x", attempts=outbox.OUTBOX_MAX_ATTEMPTS - 1)
+    first_try = _insert_event(db, status="processing", claim_token="x")
+    events = asyncio.run(db.webhook_outbox.find({"claim_token": "x"}).to_list(None))
+
+    asyncio.run(outbox._mark_for_retry(events, "SMTP fora do ar"))
+
+    failed = asyncio.run(db.webhook_outbox.find_one({"_id": last_try}))
+    assert failed["status"] == "failed"
+    assert failed["attempts"] == outbox.OUTBOX_MAX_ATTEMPTS
+    assert failed["last_error"] == "SMTP fora do ar"
+    assert "claim_token" not in failed
+
+    retried = asyncio.run(db.webhook_outbox.find_one({"_id": first_try}))
+    assert retried["status"] == "pending"
+    assert retried["attempts"] == 1
+    assert retried["available_at"] > outbox._now()
+
+
+def test_process_batch_keeps_event_open_until_mail_is_delivered(db, monkeypatch):
+    event_id = _insert_event(db)
+
+    sent = _fake_delivery(monkeypatch, delivered=False)
+    asyncio.run(outbox._process_batch(asyncio.run(outbox._claim_batch())))
+    event = asyncio.run(db.webhook_outbox.find_one({"_id": event_id}))
+    assert event["status"] == "pending" and event["mail_pending"]
+    first_hash = asyncio.run(db.users.find_one({"email": "comprador@example.com"}))["password"]
+    assert len(sent) == 1
+
+    # Nova tentativa: o usuário já existe, então gera outra senha e reenvia.
+    asyncio.run(db.webhook_outbox.update_one({"_id": event_id}, {"$set": {"available_at": outbox._now()}}))
+    sent = _fake_delivery(monkeypatch, delivered=True)
+    asyncio.run(outbox._process_batch(asyncio.run(outbox._claim_batch())))
+
+    event = asyncio.run(db.webhook_outbox.find_one({"_id": event_id}))
+    assert event["status"] == "done" and "mail_pending" not in event
+    user = asyncio.run(db.users.find_one({"email": "comprador@example.com"}))
+    assert user["password"] != first_hash
+    assert utils.verify_password(sent[0]["password"], user["password"])
+
+
+def test_process_batch_does_not_resend_to_existing_users(db, monkeypatch):
+    asyncio.run(db.users.insert_one({"name": "Cliente", "email": "comprador@example.com", "password": "hash"}))
+    event_id = _insert_event(db)
+
+    sent = _fake_delivery(monkeypatch, delivered=True)
+    asyncio.run(outbox._process_batch(asyncio.run(outbox._claim_batch())))
+
+    assert sent == []
+    assert asyncio.run(db.webhook_outbox.find_one({"_id": event_id}))["status"] == "done"
+    assert asyncio.run(db.users.find_one({"email": "comprador@example.com"}))["password"] == "hash"
+
+
+def test_process_batch_leaves_events_claimed_by_another_worker(db, monkeypatch):
+    event_id = _insert_event(db)
+    events = asyncio.run(outbox._claim_batch())
+    # O lease expirou e outro worker reivindicou o evento no meio do processamento.
+    asyncio.run(db.webhook_outbox.update_one({"_id": event_id}, {"$set": {"claim_token": "outro"}}))
+
+    sent = _fake_delivery(monkeypatch, delivered=True)
+    asyncio.run(outbox._process_batch(events))
+    asyncio.run(outbox._mark_for_retry(events, "erro"))
+
+    assert sent == []
+    event = asyncio.run(db.webhook_outbox.find_one({"_id": event_id}))
+    assert event["status"] == "processing" and event["claim_token"] == "outro"
+    assert event["attempts"] == 0
+
+
+def test_renew_lease_keeps_batch_claimed(db, monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_LEASE_SECONDS", 0.03)
+    event_id = _insert_event(db)
+    event = asyncio.run(outbox._claim_batch())[0]
+
+    async def process_slowly():
+        renewal = asyncio.create_task(outbox._renew_lease(event["claim_token"]))
+        await asyncio.sleep(0.05)
+        renewal.cancel()
+
+    asyncio.run(process_slowly())
+
+    assert asyncio.run(db.webhook_outbox.find_one({"_id": event_id}))["claimed_at"] > event["claimed_at"]
@@ -0,0 +1,108 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from app import tokens
+
+
+@pytest.fixture(autouse=True)
+def empty_version_cache():
+    tokens._version_cache.clear()
+    yield
+    tokens._version_cache.clear()
+
+
+def _add_user(db, email="cliente@example.com", **fields):
+    asyncio.run(db.users.insert_one({"name": "Cliente", "email": email, "password": "hash", **fields}))
+
+
+def test_decode_token_returns_claims(db):
+    token, expires_at = tokens.create_token("cliente@example.com", token_version=3)
+
+    claims = tokens.decode_token(token)
+
+    assert claims == {"sub": "cliente@example.com", "ver": 3, "exp": expires_at}
+
+
+def test_decode_token_rejects_tampered_payload(db):
+    token, _ = tokens.create_token("cliente@example.com")
+    payload, signature = token.split(".")
+    claims = json.loads(tokens._b64decode(payload))
+    claims["sub"] = "admin@example.com"
+    forged = tokens._b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+
+    with pytest.raises(tokens.InvalidTokenError, match="Assinatura"):
+        tokens.decode_token(f"{forged}.{signature}")
+
+
+def test_decode_token_rejects_tampered_signature(db):
+    token, _ = tokens.create_token("cliente@example.com")
+    payload, signature = token.split(".")
+    tampered = ("A" if signature[0] != "A" else "B") + signature[1:]
+
+    with pytest.raises(tokens.InvalidTokenError, match="Assinatura"):
+        tokens.decode_token(f"{payload}.{tampered}")
+
+
+def test_decode_token_rejects_token_signed_with_another_secret(db, monkeypatch):
+    monkeypatch.setattr(tokens, "_secret", b"outro-segredo")
+    token, _ = tokens.create_token("cliente@example.com")
+    monkeypatch.undo()
+
+    with pytest.raises(tokens.InvalidTokenError, match="Assinatura"):
+        tokens.decode_token(token)
+
+
+def test_decode_token_rejects_expired_token(db, monkeypatch):
+    monkeypatch.setattr(tokens, "AUTH_TOKEN_TTL", -1)
+    token, _ = tokens.create_token("cliente@example.com")
+
+    with pytest.raises(tokens.InvalidTokenError, match="expirado"):
+        tokens.decode_token(token)
+
+
+@pytest.mark.parametrize("token", ["", "sem-ponto", "a.b.c", "###.###"])
+def test_decode_token_rejects_malformed_token(db, token):
+    with pytest.raises(tokens.InvalidTokenError):
+        tokens.decode_token(token)
+
+
+def test_verify_token_rejects_token_after_revoke(db):
+    _add_user(db)
+    token, _ = tokens.create_token("cliente@example.com", token_version=0)
+    assert asyncio.run(tokens.verify_token(token))["sub"] == "cliente@example.com"
+
+    asyncio.run(tokens.revoke_tokens("cliente@example.com"))
+
+    with pytest.raises(tokens.InvalidTokenError, match="revogado"):
+        asyncio.run(tokens.verify_token(token))
+    # Um token novo, com a versão atual, continua valendo.
+    fresh, _ = tokens.create_token("cliente@example.com", token_version=1)
+    assert asyncio.run(tokens.verify_token(fresh))["ver"] == 1
+
+
+def test_verify_token_rejects_token_of_deleted_user(db):
+    token, _ = tokens.create_token("sumiu@example.com")
+
+    with pytest.raises(tokens.InvalidTokenError):
+        asyncio.run(tokens.verify_token(token))
+
+
+def test_get_current_user_accepts_bearer_token(db):
+    _add_user(db)
+    token, _ = tokens.create_token("cliente@example.com")
+
+    claims = asyncio.run(tokens.get_current_user(f"Bearer {token}"))
+
+    assert claims["sub"] == "cliente@example.com"
+
+
+@pytest.mark.parametrize("authorization", [None, "", "Bearer", "Bearer ", "Basic dXNlcjpzZW5oYQ==", "Bearer lixo"])
+def test_get_current_user_rejects_missing_or_malformed_header(db, authorization):
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(tokens.get_current_user(authorization))
+
+    assert exc_info.value.status_code == 401
+    assert exc_info.value.headers == {"WWW-Authenticate": "Bearer"}
@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+from app import database, users, utils
+
+
+def test_create_users_skips_existing_users(db):
+    asyncio.run(db.users.insert_one({"name": "Antigo", "email": "antigo@example.com", "password": "hash"}))
+
+    created = asyncio.run(users.create_users([("Antigo", "antigo@example.com"), ("Novo", "novo@example.com")]))
+
+    assert [user["email"] for user in created] == ["novo@example.com"]
+    stored = asyncio.run(db.users.find_one({"email": "novo@example.com"}))
+    assert utils.verify_password(created[0]["password"], stored["password"])
+
+
+def test_create_users_treats_duplicate_key_as_already_created(db, monkeypatch):
+    asyncio.run(database.ensure_indexes())
+    asyncio.run(db.users.insert_one({"name": "Outro processo", "email": "corrida@example.com", "password": "hash"}))
+    # Simula a corrida: a consulta de idempotência não vê o usuário criado em paralelo,
+    # então o upsert bate no índice único (E11000).
+    async def nobody_exists(emails):
+        return set()
+    monkeypatch.setattr(users, "find_existing", nobody_exists)
+
+    created = asyncio.run(users.create_users([("Corrida", "corrida@example.com"), ("Novo", "novo@example.com")]))
+
+    assert [user["email"] for user in created] == ["novo@example.com"]
+    assert asyncio.run(db.users.find_one({"email": "corrida@example.com"}))["password"] == "hash"
+
+
+def test_create_users_reraises_other_write_errors(db, monkeypatch):
+    async def failing_bulk_write(operations, ordered=True):
+        raise BulkWriteError({"writeErrors": [{"index": 0, "code": 121, "errmsg": "validation"}], "upserted": []})
+    monkeypatch.setattr(users.user_collection, "bulk_write", failing_bulk_write)
+
+    with pytest.raises(BulkWriteError):
+        asyncio.run(users.create_users([("Novo", "novo@example.com")]))